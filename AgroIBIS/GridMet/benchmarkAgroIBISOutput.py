@@ -0,0 +1,89 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4
+from agroIBISWriter import AgroIBIS_profiles, write_agroibis
+
+# This is a Python script that compares the AgroIBIS output profiles of agroIBISWriter.py. It writes the same AgroIBIS file with
+# each profile and reports the size on disk, how fast it was written, and how fast it is read back the two ways the files are used:
+# the whole grid of each day (maps) and the time series of single grid cells (the way AgroIBIS reads its inputs).
+# Throughputs are in MB per second of uncompressed double values.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# Inputs to change
+file = None # An AgroIBIS file written by gridMetAgroIBIS.py (for example Output/tmmn/tmmn_2020.nc) to test with. None makes a year of test data
+nlat = 300 # With file = None, number of latitudes of the test data (the whole GridMet CONUS grid is 585)
+nlon = 700 # With file = None, number of longitudes of the test data (the whole GridMet CONUS grid is 1386)
+dir = '.' + os.sep # Directory where the test files are written. They are deleted at the end
+profiles = list(AgroIBIS_profiles) # Profiles to compare
+days = 20 # Number of random days whose whole grid is read. Reading a day from 'cell' chunks has to decompress the whole file, so keep it small
+cells = 20 # Number of random grid cells whose time series are read. Reading a cell from 'day' chunks has to decompress every day, so keep it small
+repeats = 3 # Each time is the best of this many runs
+
+
+# This function returns a year of test data in the AgroIBIS layout: a smooth seasonal temperature field with float precision
+def test_data():
+    days = pd.date_range('2020-01-01', '2020-12-31')
+    lat = np.linspace(49.4, 25.06, nlat)
+    lon = np.linspace(-124.77, -67.06, nlon)
+    rng = np.random.default_rng(0)
+    season = -12 * np.cos(2 * np.pi * np.arange(len(days)) / 365)
+    values = 30 - 0.6 * (lat[:, None] - 25) + 3 * np.sin(lon[None, :] / 4)
+    values = season[:, None, None] + values[None, :, :] + rng.normal(0, 2, (len(days), nlat, nlon))
+    values = np.round(values, 1).astype('float32').astype('double')
+    temp = xr.Dataset({'tmmn': (('time', 'lev', 'lat', 'lon'), values[:, None, :, :])},
+                      coords={'time': days, 'lev': [1.0], 'lat': lat, 'lon': lon})
+    temp.tmmn.attrs['units'] = 'deg C'
+    return temp
+
+# This function returns the best time of repeats calls of func
+def best_time(func):
+    times = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# This function reads the whole grid of the random days of the weather variable of outfile
+def read_days(outfile, name, steps):
+    with netCDF4.Dataset(outfile) as nc:
+        var = nc.variables[name]
+        for d in steps:
+            var[d, 0, :, :]
+
+# This function reads the time series of the random grid cells of the weather variable of outfile
+def read_cells(outfile, name, points):
+    with netCDF4.Dataset(outfile) as nc:
+        var = nc.variables[name]
+        for i, j in points:
+            var[:, 0, i, j]
+
+if __name__ == '__main__':
+    data = xr.load_dataset(file) if file else test_data()
+    name = [v for v in data.data_vars if 'time' in data[v].dims][0]
+    megabytes = data[name].size * 8 / 1024 / 1024
+    rng = np.random.default_rng(1)
+    steps = rng.integers(0, data.sizes['time'], days)
+    points = list(zip(rng.integers(0, data.sizes['lat'], cells), rng.integers(0, data.sizes['lon'], cells)))
+    print('Variable ' + name + ', ' + str(dict(data[name].sizes)) + ', ' + str(round(megabytes, 1)) + ' MB as doubles')
+
+    results = []
+    for profile in profiles:
+        outfile = dir + 'benchmark_' + profile + '.nc'
+        write_time = best_time(lambda: write_agroibis(data[[name]], outfile, profile))
+        day_time = best_time(lambda: read_days(outfile, name, steps))
+        cell_time = best_time(lambda: read_cells(outfile, name, points))
+        results.append({'profile': profile,
+                        'size (MB)': round(os.path.getsize(outfile) / 1024 / 1024, 1),
+                        'write (MB/s)': round(megabytes / write_time, 1),
+                        'read days (MB/s)': round(days * data.sizes['lat'] * data.sizes['lon'] * 8 / 1024 / 1024 / day_time, 3),
+                        'read cells (MB/s)': round(cells * data.sizes['time'] * 8 / 1024 / 1024 / cell_time, 3)})
+        os.remove(outfile)
+
+    results = pd.DataFrame(results).set_index('profile')
+    # Size compared to the first profile
+    results['size (%)'] = (100 * results['size (MB)'] / results['size (MB)'].iloc[0]).round(1)
+    print(results.to_string())
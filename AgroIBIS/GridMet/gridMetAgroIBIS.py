@@ -1,215 +1,233 @@
-
-import os
-import sys
-import wget
-import xarray as xr
-import netCDF4
-
-# This is a Python script that will download minimum and maximum air temperature, precipitation, solar radiation, wind speed, and minimum, maximum and average relative humidity GridMet data.
-# It will then process the data so it is in the netCDF format needed to be input in AgroIBIS. It is customizable based on the years and spatial domain needed. Also the directory you want to download the data into 
-# is an input. 
-# This was developed off a script provided by Bryan Petersen from the VanLoocke Lab at Iowa State University. 
-# For questions, email Leslie Stoecker, lensor@illinois.edu 
-
-# Get the arguments passed through command line - ONLY uncomment if using it through a website
-#syr, eyr, latN, latS, lonW, lonE = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6]
-
-# Inputs to change
-syr = 1979 # First year to pull data. The first year in the dataset is 1979
-eyr = 2022 # Last year to pull data. There is current data, but it is not finalized currently.
-latS = 25.06 # Southern boundary for the bounding box of interest. The southern border of the data is 25.06
-latN = 49.4 # Northern boundary for the bounding box of interest. The northern border of the data is 49.4
-lonW = -124.77 # Western boundary for the bounding box of interest. The western border of the data is -124.77
-lonE = -67.06 # Eastern boundary for the bounding box of interest. The eastern border of the data is -67.06
-dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
-delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
-
-
-# Changes all the inputs to numbers
-latN = float(latN)
-latS = float(latS)
-lonW = float(lonW)
-lonE = float(lonE)
-y=int(syr)
-
-# Create folders if they do not exist
-# First location to put the full data files
-NWK_vars = ['tmmn','tmmx','pr','srad','vs','rmax','rmin']
-for v in NWK_vars:
-    var_dir = dir + v
-    if not os.path.exists(var_dir):
-        os.makedirs(var_dir)
-        
-# Location to put the AgroIBIS output data files
-output_dir = dir + 'Output'
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-OPT_vars = ['tmmn','tmax','prec','rads','wspd','high_relh','low_relh','ave_relh']
-for v in OPT_vars:
-    var_dir = output_dir + delim + v
-    if not os.path.exists(var_dir):
-        os.makedirs(var_dir)
-
-# Loop through the years needed
-while y<=int(eyr):
-    
-    # Minimum Air Temperature: Output will be tmmn_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/tmmn' + '_' + str(y) + '.nc'
-    file = dir + 'tmmn' + delim + 'tmmn_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'air_temperature':'tmmn'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.tmmn - 273.15
-    temp = temp.to_dataset()
-    temp = temp.astype('double')
-    temp.tmmn.attrs["units"] = "deg C"
-    outfile = dir + 'Output' + delim + 'tmmn' + delim + 'tmmn_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['tmmn','time','lev','lat','lon']].to_netcdf(outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: '  + str(y) + ' Minimum Temperature')
-    
-    # Maximum Air Temperature: Output will be tmax_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/tmmx' + '_' + str(y) + '.nc'
-    file = dir + 'tmmx' + delim + 'tmmx_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'air_temperature':'tmax'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.tmax - 273.15
-    temp = temp.to_dataset()
-    temp = temp.astype('double')
-    temp.tmax.attrs["units"] = "deg C"
-    outfile = dir + 'Output' + delim + 'tmax' + delim + 'tmax_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['tmax','time','lev','lat','lon']].to_netcdf(outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: ' + str(y) + ' Maximum Temperature')
-    
-    # Daily Precipitaiton Accumulation: Output will be prec_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/pr' + '_' + str(y) + '.nc'
-    file = dir + 'pr' + delim + 'pr_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'precipitation_amount':'prec'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.drop(['crs'])
-    temp = temp.astype('double')
-    temp.prec.attrs["units"] = "mm"
-    outfile = dir + 'Output' + delim + 'prec' + delim + 'prec_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['prec','time','lev','lat','lon']].to_netcdf(outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: ' + str(y) + ' Precipitation')
-    
-    # Surface Downwelling Shortwave Radiation: Output will be rads_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/srad' + '_' + str(y) + '.nc'
-    file = dir + 'srad' + delim + 'srad_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'surface_downwelling_shortwave_flux_in_air':'rads'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.drop(['crs'])
-    temp = temp.astype('double')
-    temp.rads.attrs["units"] = "W/m**2"
-    outfile = dir + 'Output' + delim + 'rads' + delim + 'rads_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['rads','time','lev','lat','lon']].to_netcdf(outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: ' + str(y) + ' Solar Radiation')
-    
-    # Wind Speed: Output will be wspd_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/vs' + '_' + str(y) + '.nc'
-    file = dir + 'vs' + delim + 'vs_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'wind_speed':'wspd'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.drop(['crs'])
-    temp = temp.astype('double')
-    temp.wspd.attrs["units"] = "m/s"
-    outfile = dir + 'Output' + delim + 'wspd' + delim + 'wspd_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['wspd','time','lev','lat','lon']].to_netcdf(outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: ' + str(y) + ' Wind Speed')
-    
-    # Maximum Relative Humidity: Output will be relh_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/rmax' + '_' + str(y) + '.nc'
-    file = dir + 'rmax' + delim + 'rmax_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'relative_humidity':'relh'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.drop(['crs'])
-    temp = temp.astype('double')
-    temp.relh.attrs["units"] = "percent"
-    highrh_outfile = dir + 'Output' + delim + 'high_relh' + delim + 'relh_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['relh','time','lev','lat','lon']].to_netcdf(highrh_outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: '  + str(y) + ' Maximum Relative Humidity')
-    
-    # Minimum Relative Humidity: Output will be relh_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/rmin_' + str(y) + '.nc'
-    file = dir + 'rmin' + delim + 'rmin_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    temp = xr.open_dataset(file)
-    temp = temp.rename({'day':'time'})
-    temp = temp.rename({'relative_humidity':'relh'})
-    temp = temp.expand_dims('lev')
-    temp = temp.assign_coords(lev = (temp.lev +1))
-    temp = temp.drop(['crs'])
-    temp = temp.astype('double')
-    temp.relh.attrs["units"] = "percent"
-    lowrh_outfile = dir + 'Output' + delim + 'low_relh' + delim + 'relh_' + str(y) + '.nc'
-    temp = temp.transpose("time","lev","lat","lon")
-    cropped_temp = temp.sel(lat=slice(latN,latS), lon=slice(lonW,lonE))
-    cropped_temp[['relh','time','lev','lat','lon']].to_netcdf(lowrh_outfile,format = "NETCDF4_CLASSIC")
-    xr.Dataset.close(temp)
-    print('Finished: '  + str(y) + ' Minimum Relative Humidity')
-    
-    
-    #Average Relative Humidity: Output is relh_yyyy.nc
-    low_rh = xr.open_dataset(lowrh_outfile)
-    high_rh = xr.open_dataset(highrh_outfile)
-    
-    rh_ave = (low_rh['relh']+high_rh['relh'])/2
-    rh_ave = rh_ave.to_dataset()
-    rh_ave = rh_ave.astype('double')
-    rh_ave.relh.attrs['units'] = 'percent'
-    rh_ave = rh_ave.transpose('time','lev','lat','lon')
-    rh_ave[['relh','time','lev','lat','lon']].to_netcdf(dir + 'Output' + delim + 'ave_relh' + delim + 'relh_' + str(y) + '.nc')
-    xr.Dataset.close(rh_ave)
-    xr.Dataset.close(low_rh)
-    xr.Dataset.close(high_rh)
-    print('Finished: ' + str(y) + ' Average Relative Humidity')
-
-    
-    y = y+1
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4
+from concurrent.futures import ProcessPoolExecutor
+from gridMetDownload import GridMetDownloader, gridmet_resolution, gridmet_url, gridmet_subset_url
+from agroIBISWriter import write_agroibis
+
+# This is a Python script that will download minimum and maximum air temperature, precipitation, solar radiation, wind speed, and minimum, maximum and average relative humidity GridMet data.
+# It will then process the data so it is in the netCDF format needed to be input in AgroIBIS. It is customizable based on the years and spatial domain needed. Also the directory you want to download the data into 
+# is an input. 
+# This was developed off a script provided by Bryan Petersen from the VanLoocke Lab at Iowa State University. 
+# For questions, email Leslie Stoecker, lensor@illinois.edu 
+
+# Get the arguments passed through command line - ONLY uncomment if using it through a website
+#import sys
+#syr, eyr, latN, latS, lonW, lonE = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6]
+
+# Inputs to change
+syr = 1979 # First year to pull data. The first year in the dataset is 1979
+eyr = 2022 # Last year to pull data. There is current data, but it is not finalized currently.
+latS = 25.06 # Southern boundary for the bounding box of interest. The southern border of the data is 25.06
+latN = 49.4 # Northern boundary for the bounding box of interest. The northern border of the data is 49.4
+lonW = -124.77 # Western boundary for the bounding box of interest. The western border of the data is -124.77
+lonE = -67.06 # Eastern boundary for the bounding box of interest. The eastern border of the data is -67.06
+dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
+delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
+download_workers = 4 # Number of GridMet files to download at the same time
+base_url = gridmet_url # Server the whole GridMet files are downloaded from. Change it to use a mirror or a local copy of the files
+subset = False # True downloads only the bounding box from the THREDDS server instead of the whole CONUS files. Large boxes still download the whole files
+subset_url = gridmet_subset_url # THREDDS NetCDF Subset Service the subsets are requested from when subset is True. Change it to use a mirror or a local server
+write_min_max_relh = True # False only writes the average relative humidity, not the maximum (high_relh) and minimum (low_relh) files
+stream = False # True converts and writes each year a few days at a time instead of loading the whole year into memory. Needs dask
+max_memory_mb = 2048 # With stream, about how much memory the data being converted and written can use at one time
+stream_workers = 2 # With stream, number of chunks converted at the same time while the previous ones are written
+output_profile = 'classic' # How the output files are stored: 'classic' (uncompressed doubles), 'zlib_day', 'zlib_cell' or 'zlib_cell_float32'. See agroIBISWriter.py
+convert_workers = 1 # Number of (variable, year) files, or (variable, year, tile) with tiles, converted at the same time, each in its own process. Each one needs the memory of one year of the bounding box or tile (or max_memory_mb with stream)
+tiles = None # (rows, columns) to split the bounding box into that many tiles, each converted on its own and written in its own Output/tile_<row>_<column> folder, for example (4, 6). None writes the whole box in Output
+write_tile_index_file = True # With tiles, also write Output/tile_index.csv with the boundaries and folder of each tile
+
+
+# Changes all the inputs to numbers
+latN = float(latN)
+latS = float(latS)
+lonW = float(lonW)
+lonE = float(lonE)
+
+# GridMet variables converted to AgroIBIS files: GridMet name -> (variable name inside the GridMet file, AgroIBIS name and output folder, units, description)
+# Temperatures are converted from Kelvin to degrees C. The maximum and minimum relative humidity are converted together in convert_relh
+AgroIBIS_vars = {
+    'tmmn': ('air_temperature', 'tmmn', 'deg C', 'Minimum Temperature'),
+    'tmmx': ('air_temperature', 'tmax', 'deg C', 'Maximum Temperature'),
+    'pr': ('precipitation_amount', 'prec', 'mm', 'Precipitation'),
+    'srad': ('surface_downwelling_shortwave_flux_in_air', 'rads', 'W/m**2', 'Solar Radiation'),
+    'vs': ('wind_speed', 'wspd', 'm/s', 'Wind Speed'),
+}
+NWK_vars = ['tmmn','tmmx','pr','srad','vs','rmax','rmin']
+OPT_vars = ['tmmn','tmax','prec','rads','wspd','high_relh','low_relh','ave_relh'] if write_min_max_relh else ['tmmn','tmax','prec','rads','wspd','ave_relh']
+
+# In streaming mode each file is opened as dask chunks of a few days, and to_netcdf converts and writes them one after the other,
+# converting the next chunks while the previous one is written. The chunk length is set so the chunks in flight stay under max_memory_mb.
+if stream:
+    import dask
+    dask.config.set(scheduler='threads', num_workers=stream_workers)
+
+# This function crops a GridMet dataset to box, a (north, south, west, east) tuple. None is the whole bounding box
+def crop(data, box=None):
+    north, south, west, east = box if box else (latN, latS, lonW, lonE)
+    return data.sel(lat=slice(north,south), lon=slice(west,east))
+
+# This function returns the chunks to open a netCDF file with: None to load the whole year at once, or in streaming mode
+# the number of days per chunk along dim. Each day of the cropped grid needs about 20 bytes per cell (float read, double and transposed copy)
+def stream_chunks(file, dim='day', box=None):
+    if not stream:
+        return None
+    with xr.open_dataset(file) as data:
+        cropped = crop(data, box)
+        cells = cropped.sizes['lat'] * cropped.sizes['lon']
+    days = int(max_memory_mb * 1024 * 1024 / (max(cells, 1) * 20 * (stream_workers + 1)))
+    return {dim: max(days, 1)}
+
+# This function splits the grid cells of the bounding box in file into tiles[0] rows by tiles[1] columns of about the same size.
+# It returns a list of (tile name, box) where box has the latitudes and longitudes of the first and last cells of the tile,
+# so the tiles do not overlap and do not miss any cell. Row 1 is the northernmost and column 1 the westernmost
+def split_tiles(file):
+    with xr.open_dataset(file) as data:
+        cropped = crop(data)
+        lats = cropped.lat.values
+        lons = cropped.lon.values
+    tile_list = []
+    for r, tile_lats in enumerate(np.array_split(lats, tiles[0])):
+        for c, tile_lons in enumerate(np.array_split(lons, tiles[1])):
+            if len(tile_lats) and len(tile_lons):
+                box = (float(tile_lats[0]), float(tile_lats[-1]), float(tile_lons[0]), float(tile_lons[-1]))
+                tile_list.append(('tile_' + str(r + 1) + '_' + str(c + 1), box))
+    return tile_list
+
+# This function writes the tile index: one line per tile with its name, row, column, boundaries (the centers of its edge cells),
+# number of cells and output folder, so each tile can be run on its own
+def write_tile_index(tile_list, file):
+    rows = []
+    with xr.open_dataset(file) as data:
+        for tile, (north, south, west, east) in tile_list:
+            cropped = crop(data, (north, south, west, east))
+            row, col = tile.split('_')[1:]
+            rows.append({'tile': tile, 'row': int(row), 'col': int(col), 'latN': north, 'latS': south, 'lonW': west, 'lonE': east,
+                         'nlat': cropped.sizes['lat'], 'nlon': cropped.sizes['lon'], 'folder': output_folder(tile)})
+    pd.DataFrame(rows).to_csv(dir + 'Output' + delim + 'tile_index.csv', index=False)
+
+# This function returns the folder the AgroIBIS files of a tile are written in: Output, or Output/<tile> when tiling
+def output_folder(tile=None):
+    return dir + 'Output' + delim + (tile + delim if tile else '')
+
+# This function opens one GridMet file and returns it as an AgroIBIS dataset named name: cropped to the bounding box (or the box of a tile)
+# right after it is opened, so only the cells inside the box are read from disk and converted to double, with a lev dimension and in the
+# time, lev, lat, lon order. Memory use depends on the size of the box instead of the whole CONUS grid.
+def open_gridmet(file, gridmet_name, name, units, box=None):
+    temp = xr.open_dataset(file, chunks=stream_chunks(file, box=box))
+    temp = temp.rename({'day':'time'})
+    temp = temp.rename({gridmet_name:name})
+    temp = crop(temp, box)
+    temp = temp.expand_dims('lev')
+    temp = temp.assign_coords(lev = (temp.lev +1))
+    if units == 'deg C':
+        temp = temp[name] - 273.15
+        temp = temp.to_dataset()
+    else:
+        temp = temp.drop_vars(['crs'], errors='ignore')
+    temp = temp.astype('double')
+    temp[name].attrs["units"] = units
+    temp = temp.transpose("time","lev","lat","lon")
+    return temp
+
+# This function converts one GridMet variable for one year, and one tile when tiling. Output will be <name>_yyyy.nc in the <name> folder of the output folder
+def convert_variable(v, y, file, tile=None, box=None):
+    gridmet_name, name, units, description = AgroIBIS_vars[v]
+    temp = open_gridmet(file, gridmet_name, name, units, box)
+    outfile = output_folder(tile) + name + delim + name + '_' + str(y) + '.nc'
+    write_agroibis(temp[[name,'time','lev','lat','lon']], outfile, output_profile)
+    xr.Dataset.close(temp)
+    print('Finished: ' + str(y) + ' ' + (tile + ' ' if tile else '') + description)
+    return outfile
+
+# This function converts the maximum and minimum relative humidity for one year (and tile) and calculates the average relative humidity
+# from them in memory. Outputs will be relh_yyyy.nc in the high_relh, low_relh and ave_relh folders.
+# The average needs both of them for the same year, so the three are done in one task
+def convert_relh(y, rmax_file, rmin_file, tile=None, box=None):
+    label = str(y) + ' ' + (tile + ' ' if tile else '')
+    high_rh = open_gridmet(rmax_file, 'relative_humidity', 'relh', 'percent', box)
+    if write_min_max_relh:
+        highrh_outfile = output_folder(tile) + 'high_relh' + delim + 'relh_' + str(y) + '.nc'
+        write_agroibis(high_rh[['relh','time','lev','lat','lon']], highrh_outfile, output_profile)
+        print('Finished: '  + label + 'Maximum Relative Humidity')
+
+    low_rh = open_gridmet(rmin_file, 'relative_humidity', 'relh', 'percent', box)
+    if write_min_max_relh:
+        lowrh_outfile = output_folder(tile) + 'low_relh' + delim + 'relh_' + str(y) + '.nc'
+        write_agroibis(low_rh[['relh','time','lev','lat','lon']], lowrh_outfile, output_profile)
+        print('Finished: '  + label + 'Minimum Relative Humidity')
+
+    rh_ave = (low_rh['relh']+high_rh['relh'])/2
+    rh_ave = rh_ave.to_dataset()
+    rh_ave = rh_ave.astype('double')
+    rh_ave.relh.attrs['units'] = 'percent'
+    rh_ave = rh_ave.transpose('time','lev','lat','lon')
+    outfile = output_folder(tile) + 'ave_relh' + delim + 'relh_' + str(y) + '.nc'
+    write_agroibis(rh_ave[['relh','time','lev','lat','lon']], outfile, output_profile, format=None)
+    xr.Dataset.close(rh_ave)
+    xr.Dataset.close(low_rh)
+    xr.Dataset.close(high_rh)
+    print('Finished: ' + label + 'Average Relative Humidity')
+    return outfile
+
+# The conversions run in separate processes, so everything below only runs when the script itself is started
+if __name__ == '__main__':
+
+    # Create folders if they do not exist
+    # First location to put the full data files
+    for v in NWK_vars:
+        var_dir = dir + v
+        if not os.path.exists(var_dir):
+            os.makedirs(var_dir)
+
+    # Start downloading every file for the years needed in the background, so downloads overlap the processing below
+    # With subset, the request is padded by one grid cell so the cropping below sees the same edge cells as the whole file.
+    # If anything fails (or the script is stopped with Ctrl-C), the downloads that have not finished and the conversions that have not started are dropped
+    bbox = (latN + gridmet_resolution, latS - gridmet_resolution, lonW - gridmet_resolution, lonE + gridmet_resolution) if subset else None
+    with GridMetDownloader(dir, delim, workers=download_workers, bbox=bbox, base_url=base_url, subset_url=subset_url) as downloader:
+        downloader.prefetch(NWK_vars, range(int(syr), int(eyr) + 1))
+
+        # With tiling, the tiles are found from the grid of the first file. Without it there is one "tile", the whole bounding box, written in Output
+        if tiles:
+            first_file = downloader.get(NWK_vars[0], int(syr))
+            tile_list = split_tiles(first_file)
+        else:
+            tile_list = [(None, None)]
+
+        # Location to put the AgroIBIS output data files
+        output_dir = dir + 'Output'
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        for tile, box in tile_list:
+            for v in OPT_vars:
+                var_dir = output_folder(tile) + v
+                if not os.path.exists(var_dir):
+                    os.makedirs(var_dir)
+        if tiles and write_tile_index_file:
+            write_tile_index(tile_list, first_file)
+
+        # Every (variable, year, tile) is its own task: as soon as a file is downloaded it is handed to one of convert_workers processes,
+        # so the conversions spread over the cores while the next files download. The relative humidity task of a year waits for
+        # both its maximum and minimum files. With convert_workers = 1 everything runs one after the other in this process
+        pool = ProcessPoolExecutor(max_workers=convert_workers) if convert_workers > 1 else None
+        try:
+            tasks = []
+            for y in range(int(syr), int(eyr) + 1):
+                for v in AgroIBIS_vars:
+                    file = downloader.get(v, y)
+                    for tile, box in tile_list:
+                        tasks.append(pool.submit(convert_variable, v, y, file, tile, box) if pool else convert_variable(v, y, file, tile, box))
+                rmax_file = downloader.get('rmax', y)
+                rmin_file = downloader.get('rmin', y)
+                for tile, box in tile_list:
+                    tasks.append(pool.submit(convert_relh, y, rmax_file, rmin_file, tile, box) if pool else convert_relh(y, rmax_file, rmin_file, tile, box))
+
+            # Wait for the conversions still running, raising the error of any that failed
+            if pool:
+                for task in tasks:
+                    task.result()
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
@@ -0,0 +1,337 @@
+import os
+import struct
+import threading
+import urllib3
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+# This is a Python module that downloads the yearly GridMet netCDF files used by gridMetDayCent.py and gridMetAgroIBIS.py.
+# The main copy is DayCent/GridMet/gridMetDownload.py: make changes there and copy the file over
+# AgroIBIS/GridMet/gridMetDownload.py, so the two stay the same.
+# Files are downloaded by a bounded pool of worker threads that share one HTTP connection pool. Each file is written to
+# <file>.part first and resumed with an HTTP Range request if the download was interrupted. The ETag or Last-Modified of the
+# server copy is saved next to the .part file and sent with If-Range, so a file that changed on the server since the download
+# started is downloaded again from the start instead of being appended to. Once the size matches the server and the netCDF
+# header checks out it is renamed to its final name, so a file that exists is always complete.
+# Files left by older runs (for example with wget) are checked the same way and downloaded again from the start if they are
+# truncated or differ in size from the server copy (the file of the current year grows every day).
+# If a bounding box is given, only the grid cells inside it are requested from the THREDDS NetCDF Subset Service instead of
+# the whole CONUS file. Large boxes, or a subset request that fails, fall back to downloading the whole file.
+# Files of the current year are updated on the server every day. refresh() gets only the days after a given date when there
+# is a bounding box, and otherwise downloads the whole file again only if the server copy changed since the last update.
+#
+# Usage:
+#   with GridMetDownloader(dir, delim, workers=4) as downloader:
+#       downloader.prefetch(['tmmn', 'tmmx'], range(2019, 2021))   # start all downloads in the background
+#       file = downloader.get('tmmn', 2019)                         # waits for that one file only
+#   with GridMetDownloader(dir, delim, bbox=(40.2, 39.9, -88.4, -88.0)) as downloader:
+#       file = downloader.get('tmmn', 2019)                         # only the cells between latN, latS, lonW, lonE
+#       file, modified = downloader.refresh('tmmn', 2024, since='2024-06-01')   # only the days from June 1
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+gridmet_url = 'http://www.northwestknowledge.net/metdata/data/'
+gridmet_subset_url = 'http://thredds.northwestknowledge.net:8080/thredds/ncss/MET/'
+
+# Name of the data variable inside each GridMet file, needed to request a subset
+gridmet_variables = {
+    'tmmn': 'air_temperature',
+    'tmmx': 'air_temperature',
+    'pr': 'precipitation_amount',
+    'srad': 'surface_downwelling_shortwave_flux_in_air',
+    'vs': 'wind_speed',
+    'rmax': 'relative_humidity',
+    'rmin': 'relative_humidity',
+}
+
+# GridMet grid spacing in degrees
+gridmet_resolution = 1/24
+
+# First bytes of a netCDF classic file and of a netCDF4 (HDF5) file
+netcdf_signature = b'CDF'
+hdf5_signature = b'\x89HDF\r\n\x1a\n'
+
+# This error is raised when a file still fails validation after all retries
+class DownloadError(Exception):
+    pass
+
+# This function returns the end-of-file address recorded in an HDF5 superblock, or None if it cannot be read.
+# A netCDF4 file shorter than this address was truncated.
+def hdf5_end_of_file(header):
+    if not header.startswith(hdf5_signature) or len(header) < 24:
+        return None
+    version = header[8]
+    if version in (0, 1):
+        offset_size = header[13]
+        address = 24 + (4 if version == 1 else 0) + 2 * offset_size
+    elif version in (2, 3):
+        offset_size = header[9]
+        address = 12 + 2 * offset_size
+    else:
+        return None
+    formats = {4: '<I', 8: '<Q'}
+    if offset_size not in formats or len(header) < address + offset_size:
+        return None
+    return struct.unpack(formats[offset_size], header[address:address + offset_size])[0]
+
+# This function checks that a downloaded file is complete: it must be a netCDF file, match the expected size
+# if one is known, and be at least as long as the end-of-file address in its HDF5 superblock
+def validate_file(file, expected_size=None):
+    if not os.path.exists(file):
+        return False
+    size = os.path.getsize(file)
+    if expected_size is not None and size != expected_size:
+        return False
+    with open(file, 'rb') as f:
+        header = f.read(64)
+    if header.startswith(netcdf_signature):
+        return True
+    end_of_file = hdf5_end_of_file(header)
+    return end_of_file is not None and size >= end_of_file
+
+# This class downloads GridMet files with a bounded pool of workers and keeps track of the ones already requested
+class GridMetDownloader:
+
+    # bbox is (latN, latS, lonW, lonE). Subsets larger than max_subset_cells grid cells are downloaded as whole files instead.
+    def __init__(self, dir, delim, workers=4, base_url=gridmet_url, retries=3, chunk_size=1024*1024, verify_existing=True,
+                 bbox=None, subset_url=gridmet_subset_url, max_subset_cells=200000):
+        self.dir = dir if dir.endswith(delim) else dir + delim
+        self.delim = delim
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.subset_url = subset_url if subset_url.endswith('/') else subset_url + '/'
+        self.bbox = bbox
+        self.max_subset_cells = max_subset_cells
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.verify_existing = verify_existing
+        self.http = urllib3.PoolManager(maxsize=workers, retries=urllib3.Retry(total=retries, backoff_factor=1))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(cancel=exc_type is not None)
+
+    # This function returns the local path of a GridMet variable and year, creating the variable folder if needed
+    def path(self, v, y, suffix=''):
+        var_dir = self.dir + v
+        if not os.path.exists(var_dir):
+            os.makedirs(var_dir, exist_ok=True)
+        return var_dir + self.delim + v + '_' + str(y) + suffix + '.nc'
+
+    def url(self, v, y):
+        return self.base_url + v + '_' + str(y) + '.nc'
+
+    # This function queues the download of every (variable, year) in the background and returns right away
+    def prefetch(self, variables, years):
+        for y in years:
+            for v in variables:
+                self.submit(v, y)
+
+    def submit(self, v, y):
+        with self.lock:
+            if (v, y) not in self.futures:
+                self.futures[(v, y)] = self.executor.submit(self.download, v, y)
+            return self.futures[(v, y)]
+
+    # This function returns the local path of a file once it has been downloaded and validated
+    def get(self, v, y):
+        return self.submit(v, y).result()
+
+    # This function waits for the downloads in progress. With cancel=True the queued downloads that have not started are dropped,
+    # and the ones in progress stop after their next chunk, leaving their .part files to be resumed by the next run.
+    # Leaving a with block because of an error (or Ctrl-C) cancels.
+    def close(self, cancel=False):
+        if cancel:
+            self.cancelled.set()
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+        self.http.clear()
+
+    # This function asks the server for the size of a file. It returns None if the server does not say.
+    def remote_size(self, url):
+        response = self.http.request('HEAD', url)
+        length = response.headers.get('Content-Length')
+        if response.status != 200 or length is None:
+            return None
+        return int(length)
+
+    # This function asks the server when a file was last changed. It returns the Last-Modified header, or None.
+    def remote_modified(self, url):
+        response = self.http.request('HEAD', url)
+        if response.status != 200:
+            return None
+        return response.headers.get('Last-Modified')
+
+    # This function deletes a .part file and the server validator saved with it
+    def remove_part(self, part):
+        for old in [part, part + '.validator']:
+            if os.path.exists(old):
+                os.remove(old)
+
+    # This function returns the local path of the subset of a GridMet variable and year for the bounding box
+    def subset_path(self, v, y):
+        return self.path(v, y, '_' + '_'.join('%.4f' % edge for edge in self.bbox))
+
+    # since is the first day to request as 'YYYY-MM-DD'. Without it the whole year is requested.
+    def subset_query(self, v, y, since=None):
+        north, south, west, east = self.bbox
+        query = {'var': gridmet_variables[v], 'north': north, 'south': south, 'west': west, 'east': east, 'horizStride': 1}
+        if since is None:
+            query['temporal'] = 'all'
+        else:
+            query['time_start'] = since + 'T00:00:00Z'
+            query['time_end'] = str(y) + '-12-31T00:00:00Z'
+        query['accept'] = 'netcdf4'
+        return self.subset_url + v + '/' + v + '_' + str(y) + '.nc?' + urlencode(query)
+
+    def subset_cells(self):
+        north, south, west, east = self.bbox
+        return (abs(north - south) / gridmet_resolution + 1) * (abs(east - west) / gridmet_resolution + 1)
+
+    # This function gets one GridMet file, either the subset for the bounding box or the whole file
+    def download(self, v, y):
+        if self.bbox is None or self.subset_cells() > self.max_subset_cells:
+            return self.download_file(v, y)
+        try:
+            return self.download_subset(v, y)
+        except (urllib3.exceptions.HTTPError, DownloadError) as e:
+            print('Subset request failed, downloading the whole file: ' + self.url(v, y) + ' (' + str(e) + ')')
+            return self.download_file(v, y)
+
+    # This function requests only the cells inside the bounding box from the subset service, for the days from since onward
+    # if it is given. Subsets are generated by the server on request, so an interrupted subset is requested again from the start.
+    # The new days are saved to one file per variable and year, <subset>_new_days.nc, that every update overwrites.
+    def download_subset(self, v, y, since=None):
+        file = self.subset_path(v, y)
+        if since is not None:
+            file = file[:-len('.nc')] + '_new_days.nc'
+        if since is None and validate_file(file):
+            return file
+        part = file + '.part'
+        self.remove_part(part)
+        expected_size = self.fetch(self.subset_query(v, y, since), part)
+        if not validate_file(part, expected_size):
+            self.remove_part(part)
+            raise DownloadError('Incomplete subset for ' + v + '_' + str(y))
+        os.replace(part, file)
+        self.remove_part(part)
+        print('Downloaded: ' + file)
+        return file
+
+    # This function gets the newest copy of a file that is still being updated on the server, and returns the local path with
+    # the Last-Modified of the server copy. With a bounding box only the days from since ('YYYY-MM-DD') onward are requested,
+    # or the whole year of the box if since is None or that request fails. Without one the whole file is downloaded again if the
+    # server copy changed after modified, the Last-Modified returned by the previous update, and the local file is kept if it did not.
+    def refresh(self, v, y, since=None, modified=None):
+        url = self.url(v, y)
+        try:
+            server_modified = self.remote_modified(url)
+        except urllib3.exceptions.HTTPError:
+            server_modified = None
+
+        if self.bbox is not None and self.subset_cells() <= self.max_subset_cells:
+            try:
+                if since is not None:
+                    try:
+                        return self.download_subset(v, y, since), server_modified
+                    except (urllib3.exceptions.HTTPError, DownloadError) as e:
+                        print('Request for the new days failed, requesting the whole year: ' + url + ' (' + str(e) + ')')
+                if os.path.exists(self.subset_path(v, y)):
+                    os.remove(self.subset_path(v, y))
+                return self.download_subset(v, y), server_modified
+            except (urllib3.exceptions.HTTPError, DownloadError) as e:
+                print('Subset request failed, checking the whole file: ' + url + ' (' + str(e) + ')')
+
+        file = self.path(v, y)
+        if os.path.exists(file) and modified is not None and server_modified == modified and validate_file(file):
+            return file, server_modified
+        # The server copy is rewritten every day, so an older local copy or partial download cannot be resumed
+        if os.path.exists(file):
+            os.remove(file)
+        self.remove_part(file + '.part')
+        return self.download_file(v, y), server_modified
+
+    # This function queues refresh() in the background and returns its future
+    def submit_refresh(self, v, y, since=None, modified=None):
+        return self.executor.submit(self.refresh, v, y, since, modified)
+
+    # This function downloads one whole file, resuming a partial download if there is one, and renames it when complete.
+    # An existing file that is not valid is downloaded again from the start: a file whose size differs from the server copy may be
+    # an older copy rather than a truncated one, and resuming it would append the end of the new file to the old one
+    def download_file(self, v, y):
+        url = self.url(v, y)
+        file = self.path(v, y)
+        part = file + '.part'
+
+        if os.path.exists(file):
+            expected_size = None
+            if self.verify_existing:
+                try:
+                    expected_size = self.remote_size(url)
+                except urllib3.exceptions.HTTPError:
+                    expected_size = None  # Offline, so check the file on its own
+            if validate_file(file, expected_size):
+                return file
+            print('Incomplete or outdated file, downloading again: ' + file)
+            os.remove(file)
+            self.remove_part(part)
+
+        for attempt in range(self.retries + 1):
+            try:
+                expected_size = self.fetch(url, part)
+            except urllib3.exceptions.HTTPError as e:
+                print('Download interrupted, resuming: ' + url + ' (' + str(e) + ')')
+                continue
+            if validate_file(part, expected_size):
+                os.replace(part, file)
+                self.remove_part(part)
+                print('Downloaded: ' + file)
+                return file
+            self.remove_part(part)  # A complete-sized file that is not valid netCDF cannot be resumed
+        raise DownloadError('Could not download a complete copy of ' + url)
+
+    # This function streams a URL into the .part file, starting from the bytes already there if the server copy has not changed
+    # since they were downloaded. A .part file without a saved validator cannot be checked, so it is downloaded again from the start.
+    # It returns the total size of the file on the server.
+    def fetch(self, url, part):
+        start = os.path.getsize(part) if os.path.exists(part) else 0
+        validator = None
+        if start > 0 and os.path.exists(part + '.validator'):
+            with open(part + '.validator') as f:
+                validator = f.read().strip()
+        headers = {'Range': 'bytes=' + str(start) + '-', 'If-Range': validator} if validator else {}
+        response = self.http.request('GET', url, headers=headers, preload_content=False)
+        try:
+            if response.status == 416:
+                # The .part file already holds every byte
+                return start
+            if response.status == 206:
+                content_range = response.headers.get('Content-Range', '')
+                total = int(content_range.split('/')[-1]) if '/' in content_range else None
+                mode = 'ab'
+            elif response.status == 200:
+                # A new download, or the server ignored the Range header or the file changed on the server, so start over
+                length = response.headers.get('Content-Length')
+                total = int(length) if length is not None else None
+                mode = 'wb'
+                # Save the validator to resume with. Weak ETags cannot be used with If-Range
+                etag = response.headers.get('ETag')
+                validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+                if validator:
+                    with open(part + '.validator', 'w') as f:
+                        f.write(validator)
+                elif os.path.exists(part + '.validator'):
+                    os.remove(part + '.validator')
+            else:
+                raise DownloadError('HTTP ' + str(response.status) + ' for ' + url)
+            with open(part, mode) as f:
+                for chunk in response.stream(self.chunk_size):
+                    if self.cancelled.is_set():
+                        raise DownloadError('Download cancelled: ' + url)
+                    f.write(chunk)
+            return total
+        finally:
+            response.release_conn()
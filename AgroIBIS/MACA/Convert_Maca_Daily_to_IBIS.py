@@ -3,750 +3,399 @@
 
 # This program will open MACAv2-METDATA datasets from their directory and convert the dataset into a usable version for Agro-IBIS. It will output the new netcdfs to designated directories. Written by Madelynn Wuestenberg.
 # The input is the files downloaded from the MACA website sitting on the server. It opens each year and pulls out the correct geographical area for the AgroIBIS. Each meteorological element is written out into a new netcdf file. Also, it calculates the daily relative humidity and the uv wind, which are also output.
+# Every variable of every scenario is converted the same way, following the MACA_vars table below, and each (variable, scenario, file) is its own task
+# so the whole conversion runs as one job over several processes.
 
 
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import matplotlib.pyplot as plt
-import metpy.calc as mpcalc
-from metpy.units import units
+# Only the modules every run needs are imported here, since every worker process loads them again. Modules only some runs need
+# are imported by the step that uses them: dask with stream, scipy to regrid and xesmf to make new regridding weights
 import numpy as np
 import pandas as pd
 import xarray as xr
-import xesmf
 import netCDF4
 import os
 import glob
-import datetime as dt
-
-
-# This is set up for historical tmin
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_tmin/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_tmin/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        #temp = temp.rename({'day':'time'})
-        temp = temp.rename({'air_temperature':'tmin'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        temp = temp.tmin - 273.15
-     
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-    
+import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from agroIBISWriter import write_agroibis
+
+# Inputs to change
+maca_dir = '/Volumes/Madelynn_Raid/maca_testdata/' # Need to change to the location of the MACA files. Each variable is in new1_<variable>/<scenario>
+output_dir = '/Volumes/Madelynn_Raid/maca/' # Need to change to the location of where to write
+workers = 4 # Number of files converted at the same time, each in its own process. Each one needs the memory of one MACA file
+output_profile = 'classic' # How the output files are stored: 'classic' (uncompressed doubles), 'zlib_day', 'zlib_cell' or 'zlib_cell_float32'. See agroIBISWriter.py
+write_min_max_relh = True # False only writes the average relative humidity and skips the maximum (high_relh) and minimum (low_relh) files
+write_u_v = False # True also writes the eastward (u) and northward (v) wind files, not only the wind speed (wspd)
+incremental = True # True only converts the years whose output files are missing, older than their MACA files, or written with other settings. False converts everything again
+model = None # MACA model to convert when the folders have files of several models, for example 'CCSM4'. None uses every file
+latS = None # Southern boundary of the bounding box to convert, in decimal degrees north. None for latS, latN, lonW and lonE converts the whole MACA domain
+latN = None # Northern boundary of the bounding box to convert
+lonW = None # Western boundary of the bounding box to convert, in decimal degrees east (-180 to 180)
+lonE = None # Eastern boundary of the bounding box to convert
+stream = False # True converts and writes each file a few days at a time instead of loading the whole file into memory. Needs dask
+max_memory_mb = 2048 # With stream, about how much memory the data being converted and written by one worker can use at one time
+stream_workers = 2 # With stream, number of chunks converted at the same time by each worker while the previous ones are written
+regrid_file = None # A netCDF file on the grid to write the files on, for example a GridMet file or a file written by gridMetAgroIBIS.py. None keeps the MACA grid
+regrid_method = 'bilinear' # xesmf regridding method: 'bilinear', 'conservative', 'nearest_s2d', ...
+regrid_batch_days = 32 # Number of days regridded in one matrix multiply
+weights_dir = output_dir + 'regrid_weights/' # Where the regridding weights are saved, so they are only made once for each pair of grids
+
+# Scenarios to convert. The year of each file is read from its time coordinate
+MACA_scenarios = ['historical', 'rcp45', 'rcp85']
+
+# MACA variables converted for AgroIBIS: folder of the MACA files -> (variable name in the MACA files, AgroIBIS variable name, units,
+# conversion, output file). The output file is under output_dir, with {scenario} and {year} filled in.
+# Conversion 'kelvin' converts from Kelvin to degrees C, 'double' converts to double
+MACA_vars = {
+    'tmin': ('air_temperature', 'tmin', 'deg C', 'kelvin', 'tmin/{scenario}/tmin_{year}.nc'),
+    'tmax': ('air_temperature', 'tmax', 'deg C', 'kelvin', 'tmax/{scenario}/tmax_{year}.nc'),
+    'precip': ('precipitation', 'prec', 'mm', 'double', 'prec/{scenario}/prec_{year}.nc'),
+    'solrad': ('surface_downwelling_shortwave_flux_in_air', 'rads', 'W/m**2', 'double', 'rads/{scenario}/rads_{year}.nc'),
+    'rhmax': ('relative_humidity', 'relh', 'percent', 'double', 'high_relh/{scenario}/relh_{year}.nc'),
+    'rhmin': ('relative_humidity', 'relh', 'percent', 'double', 'low_relh/{scenario}/relh_{year}.nc'),
+    'u': ('eastward_wind', 'wspd', 'm/s', 'double', 'u/{scenario}/u_{year}.nc'),
+    'v': ('northward_wind', 'wspd', 'm/s', 'double', 'v/{scenario}/v_{year}.nc'),
+}
+# The average relative humidity is calculated from rhmax and rhmin, and the wind speed from u and v in the same task
+ave_relh_file = 'ave_rh/{scenario}/relh_{year}.nc'
+wspd_file = 'wspd/{scenario}/wspd_{year}.nc'
+
+# The catalog of the MACA files is saved here, so only new or changed files are opened the next time
+catalog_file = output_dir + 'maca_catalog.csv'
+catalog_columns = ['variable', 'scenario', 'model', 'first_year', 'last_year', 'file', 'size', 'mtime']
+
+# This function returns the model in the name of a MACA file (macav2metdata_<variable>_<model>_<ensemble>_<scenario>_...), or '' if it has none
+def maca_model(filename):
+    match = re.match(r'macav2[a-z]*_[^_]+_([^_]+)_r\d+i\d+p\d+_', os.path.basename(filename))
+    return match.group(1) if match else ''
+
+# This function returns the first and last year of a MACA file. Only its time coordinate is read
+def maca_years(filename):
+    with netCDF4.Dataset(filename) as nc:
+        time = nc.variables['time']
+        first, last = netCDF4.num2date([time[0], time[-1]], time.units, getattr(time, 'calendar', 'standard'))
+    return first.year, last.year
+
+# This function scans the MACA files of every variable and scenario and returns the catalog: one row per file with its variable, scenario,
+# model, first and last year, size and modification time. Files with the same size and modification time as in the saved catalog are not
+# opened again. The catalog is saved in catalog_file
+def build_catalog():
+    saved = pd.read_csv(catalog_file, keep_default_na=False).set_index('file') if os.path.exists(catalog_file) else None
+    rows = []
+    for v in MACA_vars:
+        for scenario in MACA_scenarios:
+            for filename in sorted(glob.glob(f"{maca_dir}new1_{v}/{scenario}/*.nc")):
+                size, mtime = os.path.getsize(filename), os.path.getmtime(filename)
+                if saved is not None and filename in saved.index and saved.loc[filename, 'size'] == size and saved.loc[filename, 'mtime'] == mtime:
+                    first_year, last_year = int(saved.loc[filename, 'first_year']), int(saved.loc[filename, 'last_year'])
+                else:
+                    first_year, last_year = maca_years(filename)
+                rows.append([v, scenario, maca_model(filename), first_year, last_year, filename, size, mtime])
+    catalog = pd.DataFrame(rows, columns=catalog_columns)
+    catalog.to_csv(catalog_file, index=False)
+    return catalog
+
+# This function returns the MACA file of each year of a variable and scenario in the catalog, as a dictionary year -> file
+def maca_files(catalog, v, scenario):
+    rows = catalog[(catalog.variable == v) & (catalog.scenario == scenario)]
+    if model:
+        rows = rows[rows.model == model]
+    files = {}
+    for row in rows.itertuples():
+        for year in range(row.first_year, row.last_year + 1):
+            if year in files:
+                raise ValueError('Several MACA files have ' + v + ' ' + scenario + ' ' + str(year) + ': ' + files[year] + ' and ' + row.file + '. Set model to the one to convert')
+            files[year] = row.file
+    return files
+
+# The settings every output file was written with are saved here: output file -> fingerprint of the MACA files and settings it came from
+outputs_file = output_dir + 'maca_outputs.csv'
+
+# This function returns the fingerprint of the settings that change the output files made from the MACA files sources: the output profile,
+# bounding box and regridding, and the MACA files themselves (so changing model converts again)
+def conversion_settings(sources):
+    settings = [output_profile, latS, latN, lonW, lonE, regrid_file, regrid_method if regrid_file else None] + sorted(sources)
+    return hashlib.md5(repr(settings).encode()).hexdigest()[:16]
+
+# This function returns the saved fingerprint of every output file written by earlier runs
+def load_outputs():
+    if not os.path.exists(outputs_file):
+        return {}
+    return pd.read_csv(outputs_file, keep_default_na=False).set_index('file')['settings'].to_dict()
+
+def save_outputs(written):
+    pd.DataFrame(sorted(written.items()), columns=['file', 'settings']).to_csv(outputs_file + '.part', index=False)
+    os.replace(outputs_file + '.part', outputs_file)
+
+# This function returns True if a task has to run: incremental is False, or one of its output files is missing, older than one of its
+# MACA files, or was written with other settings (see conversion_settings). written is the saved fingerprint of every output file
+def out_of_date(outputs, sources, written):
+    if not incremental:
+        return True
+    newest = max(os.path.getmtime(f) for f in sources)
+    settings = conversion_settings(sources)
+    return any(not os.path.exists(f) or os.path.getmtime(f) < newest or written.get(f) != settings for f in outputs)
+
+# This function returns the path of an output file from its pattern
+def output_file(pattern, scenario, year):
+    return output_dir + pattern.format(scenario=scenario, year=year)
+
+# Longitude order of each MACA grid, computed the first time a file on the grid is opened and reused for all the others:
+# longitudes of the grid -> (its longitudes within (-180, 180) in increasing order, how to put the cells in that order)
+lon_orders = {}
+
+# This function returns the longitudes of a MACA grid within (-180, 180) in increasing order and how to put the grid in that order:
+# None if it already is, the number of cells to roll the grid by when the cells over 180 only have to move to the front,
+# or else the index of each cell
+def lon_order(lon):
+    key = lon.tobytes()
+    if key not in lon_orders:
+        adjusted = np.where(lon > 180, lon - 360, lon)
+        index = np.argsort(adjusted, kind='stable')
+        shift = len(lon) - int(index[0])
+        if np.array_equal(index, np.arange(len(lon))):
+            order = None
+        elif np.array_equal(index, np.roll(np.arange(len(lon)), shift)):
+            order = shift
+        else:
+            order = index
+        lon_orders[key] = (adjusted[index], order)
+    return lon_orders[key]
+
+# This function puts the longitudes of a MACA dataset within (-180, 180) in increasing order. MACA longitudes are all over 180, so usually
+# only the coordinate values change and the data is not copied. Otherwise the grid is rolled, which reads it in two contiguous pieces
+def normalize_lon(temp):
+    lon, order = lon_order(temp.lon.values)
+    if isinstance(order, int):
+        temp = temp.roll(lon=order, roll_coords=True)
+    elif order is not None:
+        temp = temp.isel(lon=order)
+    return temp.assign_coords(lon=('lon', lon, temp.lon.attrs))
+
+# In streaming mode each file is opened as dask chunks of a few days, and to_netcdf converts and writes them one after the other,
+# converting the next chunks while the previous one is written. The chunk length is set so the chunks in flight stay under max_memory_mb.
+if stream:
+    import dask
+    dask.config.set(scheduler='threads', num_workers=stream_workers)
+
+# This function crops a MACA dataset, with its longitudes already within (-180, 180), to the bounding box. Only the cells inside the box
+# are then read from the file, whatever the order of the latitudes and longitudes. With regrid_file the box is padded by two MACA cells, so the cells at its edges can be regridded
+def crop(temp):
+    if latS is None:
+        return temp
+    pad = 2 * abs(float(temp.lat[1] - temp.lat[0])) if regrid_file else 0
+    lat, lon = temp.lat.values, temp.lon.values
+    return temp.isel(lat=np.flatnonzero((lat >= latS - pad) & (lat <= latN + pad)),
+                     lon=np.flatnonzero((lon >= lonW - pad) & (lon <= lonE + pad)))
+
+# This function returns the chunks to open a MACA file with: None to load it at once, or in streaming mode the number of days per chunk.
+# Each day of the cropped grid needs about 20 bytes per cell (float read, double and transposed copy)
+def stream_chunks(filename):
+    if not stream:
+        return None
+    with xr.open_dataset(filename) as data:
+        cropped = crop(normalize_lon(data.drop_vars(list(data.data_vars))))
+        cells = cropped.sizes['lat'] * cropped.sizes['lon']
+    days = int(max_memory_mb * 1024 * 1024 / (max(cells, 1) * 20 * (stream_workers + 1)))
+    return {'time': max(days, 1)}
+
+# Regridding weights already read by this process: (MACA latitudes, longitudes) -> sparse matrix
+regrid_cache = {}
+
+# This function returns the latitudes and longitudes of the regrid_file grid inside the bounding box
+def target_grid():
+    with xr.open_dataset(regrid_file) as data:
+        lat, lon = data.lat.values, data.lon.values
+    if latS is not None:
+        lat = lat[(lat >= latS) & (lat <= latN)]
+        lon = lon[(lon >= lonW) & (lon <= lonE)]
+    return lat, lon
+
+# This function returns the regridding weights from a MACA grid to the regrid_file grid, as a sparse matrix of (grid cells of regrid_file)
+# by (MACA grid cells). They are made with xesmf the first time and saved in weights_dir, named after the two grids and the method,
+# and then read back from there by every other file and process
+def regrid_weights(lat, lon):
+    key = (lat.tobytes(), lon.tobytes())
+    if key not in regrid_cache:
+        target_lat, target_lon = target_grid()
+        grids = hashlib.md5(lat.tobytes() + lon.tobytes() + target_lat.tobytes() + target_lon.tobytes()).hexdigest()[:16]
+        weights_file = weights_dir + regrid_method + '_' + grids + '.nc'
+        if not os.path.exists(weights_file):
+            import xesmf
+            regridder = xesmf.Regridder(xr.Dataset(coords={'lat': lat, 'lon': lon}), xr.Dataset(coords={'lat': target_lat, 'lon': target_lon}), regrid_method)
+            regridder.to_netcdf(weights_file + '.part')
+            os.replace(weights_file + '.part', weights_file)
+        import scipy.sparse
+        # xesmf saves the weights as the rows, columns (both counted from 1) and values of the matrix
+        with xr.open_dataset(weights_file) as weights:
+            matrix = scipy.sparse.csr_matrix((weights.S.values, (weights.row.values - 1, weights.col.values - 1)),
+                                             shape=(len(target_lat) * len(target_lon), len(lat) * len(lon)))
+        regrid_cache[key] = matrix
+    return regrid_cache[key]
+
+# This function regrids the variable name of a MACA dataset to the regrid_file grid. The grid of every day is one column, so
+# regrid_batch_days days are read and regridded by one multiply of the sparse weights at a time
+def regrid(temp, name):
+    values = temp[name].transpose('time', ..., 'lat', 'lon')
+    matrix = regrid_weights(temp.lat.values, temp.lon.values)
+    target_lat, target_lon = target_grid()
+    out = np.empty(values.shape[:-2] + (matrix.shape[0],), dtype=values.dtype)
+    for start in range(0, values.sizes['time'], regrid_batch_days):
+        days = values.isel(time=slice(start, start + regrid_batch_days)).values
+        flat = days.reshape(-1, days.shape[-2] * days.shape[-1])
+        out[start:start + regrid_batch_days] = (matrix @ flat.T).T.reshape(days.shape[:-2] + (matrix.shape[0],))
+    out = out.reshape(values.shape[:-2] + (len(target_lat), len(target_lon)))
+    coords = {d: temp[d].values for d in values.dims[:-2] if d in temp.coords}
+    coords.update({'lat': target_lat, 'lon': target_lon})
+    return xr.DataArray(out, dims=values.dims, coords=coords, attrs=values.attrs, name=name).to_dataset()
+
+# This function opens a MACA file of variable v and puts it in the AgroIBIS layout: renamed, with a lev dimension,
+# longitudes within (-180, 180), converted and in the time, lev, lat, lon order
+def open_maca(filename, v, year):
+    source, name, units, conversion, pattern = MACA_vars[v]
+    temp = xr.open_dataset(filename, chunks=stream_chunks(filename))
+    # Files with several years are cut to the year being converted
+    if temp.time.dt.year[0] != temp.time.dt.year[-1]:
+        temp = temp.sel(time=str(year))
+    temp = temp.rename({source:name})
+    temp = temp.expand_dims("lev")
+    temp = temp.assign_coords(lev = (temp.lev +1))
+    temp = normalize_lon(temp)
+    temp = crop(temp)
+    if conversion == 'kelvin':
+        temp = temp[name] - 273.15
         temp = temp.to_dataset()
-        file_2 = f"/Volumes/Madelynn_Raid/maca/tmin/{dirname}/tmin_%s.nc" % year # Need to change to the location of where to write
-        temp.tmin.attrs["units"] = "deg C"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['tmin','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for tmin
-
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_tmin/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_tmin/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        #temp = temp.rename({'day':'time'})
-        temp = temp.rename({'air_temperature':'tmin'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        temp = temp.tmin - 273.15
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        temp = temp.to_dataset()
-        file_2 = f"/Volumes/Madelynn_Raid/maca/tmin/{dirname}/tmin_%s.nc" % year # Need to change to the location of where to write
-        temp.tmin.attrs["units"] = "deg C"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['tmin','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is set up for historical tmax
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_tmax/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_tmax/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'air_temperature':'tmax'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        temp = temp.tmax - 273.15
-    
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        temp = temp.to_dataset()
-        temp.tmax.attrs["units"] = "deg C"
-        file_2 = f"/Volumes/Madelynn_Raid/maca/tmax/{dirname}/tmax_%s.nc" % year # Need to change to the location of where to write
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['tmax','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for tmax
-
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_tmax/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_tmax/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'air_temperature':'tmax'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        temp = temp.tmax - 273.15
-    
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-    
-        temp = temp.to_dataset()
-        temp.tmax.attrs["units"] = "deg C"
-        file_2 = f"/Volumes/Madelynn_Raid/maca/tmax/{dirname}/tmax_%s.nc" % year # Need to change to the location of where to write
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['tmax','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is set up for historical precipitation
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_precip/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_precip/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'precipitation':'prec'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-    
-        #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        #temp = temp.to_dataset()
-        temp.prec.attrs["units"] = "mm"
-        file_2 = f"/Volumes/Madelynn_Raid/maca/prec/{dirname}/prec_%s.nc" % year # Need to change to the location of where to write
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['prec','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for precipitation
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_precip/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_precip/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'precipitation':'prec'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        #temp = temp.to_dataset()
-        temp.prec.attrs["units"] = "mm"
-        file_2 = f"/Volumes/Madelynn_Raid/maca/prec/{dirname}/prec_%s.nc" % year # Need to change to the location of where to write
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['prec','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is set up for historical solar radiation
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_solrad/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_solrad/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'surface_downwelling_shortwave_flux_in_air':'rads'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        
-        #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/rads/{dirname}/rads_%s.nc" % year # Need to change to the location of where to write
-        temp.rads.attrs["units"] = "W/m**2"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['rads','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for solar radiation
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_solrad/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_solrad/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'surface_downwelling_shortwave_flux_in_air':'rads'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        
-        #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/rads/{dirname}/rads_%s.nc" % year # Need to change to the location of where to write
-        temp.rads.attrs["units"] = "W/m**2"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['rads','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir("..")
-
-# This is set up for historical maximum relative humidity
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_rhmax/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_rhmax/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'relative_humidity':'relh'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-        
-        
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/high_relh/{dirname}/relh_%s.nc" % year # Need to change to the location of where to write
-        temp.relh.attrs["units"] = "percent"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for maximum relative humidity
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_rhmax/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_rhmax/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'relative_humidity':'relh'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/high_relh/{dirname}/relh_%s.nc" % year # Need to change to the location of where to write
-        temp.relh.attrs["units"] = "percent"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is set up for historical minimum relative humidity
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_rhmin/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_rhmin/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'relative_humidity':'relh'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/low_relh/{dirname}/relh_%s.nc" % year # Need to change to the location of where to write
-        temp.relh.attrs["units"] = "percent"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for minimum relative humidity
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_rhmin/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_rhmin/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-        temp = temp.rename({'relative_humidity':'relh'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/low_relh/{dirname}/relh_%s.nc" % year # Need to change to the location of where to write
-        temp.relh.attrs["units"] = "percent"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# Calculate the mean rh from the high and low datasets
-for yr in range(1950,2006):   
-
- low_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/low_relh/historical/relh_{yr}.nc") # Need to change to the location of where the files written above are
- high_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/high_relh/historical/relh_{yr}.nc") # Need to change to the location of where the files written above are
-
- rh_ave = (low_rh['relh']+high_rh['relh'])/2
- rh_ave = rh_ave.to_dataset()
- rh_ave = rh_ave.astype('double')
- rh_ave.relh.attrs["units"] = "percent"
- rh_ave = rh_ave.transpose("time","lev","lat","lon")
- file_2 = f"/Volumes/Madelynn_Raid/maca/ave_rh/historical/relh_{yr}.nc" # Need to change to the location of where to write
- rh_ave[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
- xr.Dataset.close(rh_ave)
- xr.Dataset.close(low_rh)
- xr.Dataset.close(high_rh)
-
-# Calculate the mean rh for the RCP4.5 dataset
-for yr in range(2006,2100):   
-
- low_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/low_relh/rcp45/relh_{yr}.nc") # Need to change to the location of where the files written above are
- high_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/high_relh/rcp45/relh_{yr}.nc") # Need to change to the location of where the files written above are
-
- rh_ave = (low_rh['relh']+high_rh['relh'])/2
- rh_ave = rh_ave.to_dataset()
- rh_ave = rh_ave.astype('double')
- rh_ave.relh.attrs["units"] = "percent"
- rh_ave = rh_ave.transpose("time","lev","lat","lon")
- file_2 = f"/Volumes/Madelynn_Raid/maca/ave_rh/rcp45/relh_{yr}.nc" # Need to change to the location of where to write
- rh_ave[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
- xr.Dataset.close(rh_ave)
- xr.Dataset.close(low_rh)
- xr.Dataset.close(high_rh)
-
-# Calculate the mean rh for the RCP8.5 dataset
-for yr in range(2006,2100):   
-
- low_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/low_relh/rcp85/relh_{yr}.nc") # Need to change to the location of where the files written above are
- high_rh = xr.open_dataset(f"/Volumes/Madelynn_Raid/maca/high_relh/rcp85/relh_{yr}.nc") # Need to change to the location of where the files written above are
-
- rh_ave = (low_rh['relh']+high_rh['relh'])/2
- rh_ave = rh_ave.to_dataset()
- rh_ave = rh_ave.astype('double')
- rh_ave.relh.attrs["units"] = "percent"
- rh_ave = rh_ave.transpose("time","lev","lat","lon")
- file_2 = f"/Volumes/Madelynn_Raid/maca/ave_rh/rcp85/relh_{yr}.nc" # Need to change to the location of where to write
- rh_ave[['relh','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
- xr.Dataset.close(rh_ave)
- xr.Dataset.close(low_rh)
- xr.Dataset.close(high_rh)
-
-# This is set up for historical eastward wind
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_u/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_u/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-    # temp = temp.rename({'day':'time'})
-        temp = temp.rename({'eastward_wind':'wspd'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/u/historical/u_%s.nc" % year # Need to change to the location of where to write
-        temp.wspd.attrs["units"] = "m/s"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['wspd','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for eastward wind
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_u/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_u/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-    # temp = temp.rename({'day':'time'})
-        temp = temp.rename({'eastward_wind':'wspd'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/u/{dirname}/u_%s.nc" % year # Need to change to the location of where to write
-        temp.wspd.attrs["units"] = "m/s"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['wspd','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is set up for historical northward wind
-for dirname in ["historical"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_v/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 1950
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_v/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-    # temp = temp.rename({'day':'time'})
-        temp = temp.rename({'northward_wind':'wspd'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
-        temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/v/historical/v_%s.nc" % year # Need to change to the location of where to write
-        temp.wspd.attrs["units"] = "m/s"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['wspd','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-
-# This is for future scenarios, RCP4.5 and RCP8.5, for northward wind
-for dirname in ["rcp45", "rcp85"]:
-    path = f'/Volumes/Madelynn_Raid/maca_testdata/new1_v/{dirname}' # Need to change to the location of the MACA files
-    os.chdir(path)
-    year = 2006
-    for filename in glob.glob(f"/Volumes/Madelynn_Raid/maca_testdata/new1_v/{dirname}/*.nc"): # Need to change to the location of the MACA files
-        temp = xr.open_dataset(filename)
-    # temp = temp.rename({'day':'time'})
-        temp = temp.rename({'northward_wind':'wspd'})
-        temp = temp.expand_dims("lev")
-        temp = temp.assign_coords(lev = (temp.lev +1))
-        
-        lon_name = 'lon'  # whatever name is in the data
-
-        # Adjust lon values to make sure they are within (-180, 180)
-        temp['_longitude_adjusted'] = xr.where(
-            temp[lon_name] > 180,
-            temp[lon_name] - 360,
-            temp[lon_name])
-
-        # reassign the new coords to as the main lon coords
-        # and sort DataArray using new coordinate values
-        temp = (
-            temp
-            .swap_dims({lon_name: '_longitude_adjusted'})
-            .sel(**{'_longitude_adjusted': sorted(temp._longitude_adjusted)})
-            .drop(lon_name))
-
-        temp = temp.rename({'_longitude_adjusted': lon_name})
-     #temp = temp.drop(['crs'])
+    else:
         temp = temp.astype('double')
-        file_2 = f"/Volumes/Madelynn_Raid/maca/v/{dirname}/v_%s.nc" % year # Need to change to the location of where to write
-        temp.wspd.attrs["units"] = "m/s"
-        temp = temp.transpose("time","lev","lat","lon")
-        temp[['wspd','time','lev','lat','lon']].to_netcdf(file_2,format = "NETCDF4_CLASSIC")
-        year = year+1
-        xr.Dataset.close(temp)
-        temp.close()
-    os.chdir('..')
-  
-# Combine the historical u and v wind into one wind speed
-for year in range(1950,2006):
-    u = xr.open_dataset('/Volumes/Madelynn_Raid/maca/u/historical/u_%s.nc' % year) # Need to change to the location of where the files written above are
-    #print(u)
-    #u = u.rename({'eastward_wind':'wspd'})
-    v = xr.open_mfdataset('/Volumes/Madelynn_Raid/maca/v/historical/v_%s.nc' % year) # Need to change to the location of where the files written above are
-    #v = v.rename({'northward_wind':'wspd'})
-    u['wspd'] = wind_uv_to_spd(u.wspd,v.wspd)
-    file_2 = f"/Volumes/Madelynn_Raid/maca/wspd/historical/wspd_{year}.nc" # Need to change to the location of where to write
-    u.to_netcdf(file_2, format = "NETCDF4_CLASSIC")
-    u.close()
-    v.close()
-
-# Combine the future RCP4.5 u and v wind into one wind speed
-for year in range(2006,2100):
-    u = xr.open_dataset('/Volumes/Madelynn_Raid/maca/u/rcp45/u_%s.nc' % year) # Need to change to the location of where the files written above are
-    #print(u)
-    #u = u.rename({'eastward_wind':'wspd'})
-    v = xr.open_mfdataset('/Volumes/Madelynn_Raid/maca/v/rcp45/v_%s.nc' % year) # Need to change to the location of where the files written above are
-    #v = v.rename({'northward_wind':'wspd'})
-    u['wspd'] = wind_uv_to_spd(u.wspd,v.wspd)
-    file_2 = f"/Volumes/Madelynn_Raid/maca/wspd/rcp45/wspd_{year}.nc" # Need to change to the location of where to write
-    u.to_netcdf(file_2, format = "NETCDF4_CLASSIC")
-    u.close()
-    v.close()
-
-# Combine the future RCP8.5 u and v wind into one wind speed
-for year in range(2006,2100):
-    u = xr.open_dataset('/Volumes/Madelynn_Raid/maca/u/rcp85/u_%s.nc' % year) # Need to change to the location of where the files written above are
-    #print(u)
-    #u = u.rename({'eastward_wind':'wspd'})
-    v = xr.open_mfdataset('/Volumes/Madelynn_Raid/maca/v/rcp85/v_%s.nc' % year) # Need to change to the location of where the files written above are
-    #v = v.rename({'northward_wind':'wspd'})
-    u['wspd'] = wind_uv_to_spd(u.wspd,v.wspd)
-    file_2 = f"/Volumes/Madelynn_Raid/maca/wspd/rcp85/wspd_{year}.nc" # Need to change to the location of where to write
-    u.to_netcdf(file_2, format = "NETCDF4_CLASSIC")
-    u.close()
-    v.close()
+    if regrid_file:
+        temp = regrid(temp, name)
+    temp[name].attrs["units"] = units
+    temp = temp.transpose("time","lev","lat","lon")
+    return temp
+
+# This function converts one MACA file of variable v
+def convert_file(v, scenario, year, filename):
+    name = MACA_vars[v][1]
+    temp = open_maca(filename, v, year)
+    file_2 = output_file(MACA_vars[v][4], scenario, year)
+    write_agroibis(temp[[name,'time','lev','lat','lon']], file_2, output_profile)
+    xr.Dataset.close(temp)
+    print('Finished: ' + scenario + ' ' + str(year) + ' ' + v)
+    return file_2
+
+# This function converts the maximum and minimum relative humidity of one year and calculates the average relative humidity
+# from them in memory, instead of writing them out and reading them back in. The average needs both, so the three are one task
+def convert_relh(scenario, year, rhmax_file, rhmin_file):
+    high_rh = open_maca(rhmax_file, 'rhmax', year)
+    low_rh = open_maca(rhmin_file, 'rhmin', year)
+
+    if write_min_max_relh:
+        write_agroibis(high_rh[['relh','time','lev','lat','lon']], output_file(MACA_vars['rhmax'][4], scenario, year), output_profile)
+        write_agroibis(low_rh[['relh','time','lev','lat','lon']], output_file(MACA_vars['rhmin'][4], scenario, year), output_profile)
+
+    # Calculate the mean rh from the high and low datasets
+    rh_ave = (low_rh['relh']+high_rh['relh'])/2
+    rh_ave = rh_ave.to_dataset()
+    rh_ave = rh_ave.astype('double')
+    rh_ave.relh.attrs["units"] = "percent"
+    rh_ave = rh_ave.transpose("time","lev","lat","lon")
+    file_2 = output_file(ave_relh_file, scenario, year)
+    write_agroibis(rh_ave[['relh','time','lev','lat','lon']], file_2, output_profile)
+    xr.Dataset.close(rh_ave)
+    xr.Dataset.close(low_rh)
+    xr.Dataset.close(high_rh)
+    print('Finished: ' + scenario + ' ' + str(year) + ' relh')
+    return file_2
+
+# This function calculates the wind speed of one year from the eastward (u) and northward (v) wind, read together in the same task.
+# The wind speed is the length of the wind vector, sqrt(u**2 + v**2), calculated with numpy's hypot over the whole year at once.
+# The u and v files are only written with write_u_v
+def convert_wind(scenario, year, u_file, v_file):
+    u = open_maca(u_file, 'u', year)
+    v = open_maca(v_file, 'v', year)
+
+    if write_u_v:
+        write_agroibis(u[['wspd','time','lev','lat','lon']], output_file(MACA_vars['u'][4], scenario, year), output_profile)
+        write_agroibis(v[['wspd','time','lev','lat','lon']], output_file(MACA_vars['v'][4], scenario, year), output_profile)
+
+    wspd = np.hypot(u['wspd'], v['wspd'])
+    wspd = wspd.to_dataset(name='wspd')
+    wspd.wspd.attrs["units"] = "m/s"
+    wspd = wspd.transpose("time","lev","lat","lon")
+    file_2 = output_file(wspd_file, scenario, year)
+    write_agroibis(wspd[['wspd','time','lev','lat','lon']], file_2, output_profile)
+    xr.Dataset.close(wspd)
+    xr.Dataset.close(u)
+    xr.Dataset.close(v)
+    print('Finished: ' + scenario + ' ' + str(year) + ' wspd')
+    return file_2
+
+# The conversions run in separate processes, so everything below only runs when the script itself is started
+if __name__ == '__main__':
+
+    # Find the years of every MACA file from its time coordinate (only for files that are new or changed since the last run)
+    os.makedirs(output_dir, exist_ok=True)
+    catalog = build_catalog()
+
+    # Make the regridding weights from the MACA grid (cropped to the bounding box) once, before the files are handed to the workers processes
+    if regrid_file and len(catalog):
+        os.makedirs(weights_dir, exist_ok=True)
+        with xr.open_dataset(catalog.file.iloc[0]) as first:
+            grid = crop(normalize_lon(first.drop_vars(list(first.data_vars))))
+            regrid_weights(grid.lat.values, grid.lon.values)
+
+    # Every (variable, scenario, year) is its own task, and all of them are handed to the same workers processes.
+    # The maximum and minimum relative humidity of the same year are one task, and so are the u and v wind. With incremental,
+    # tasks whose output files are all newer than their MACA files and written with the same settings are skipped.
+    # With workers = 1 everything runs one after the other. Each task is (output files, MACA files, function, arguments)
+    written = load_outputs()
+    tasks = []
+    for scenario in MACA_scenarios:
+        for v in MACA_vars:
+            if v in ('rhmax', 'rhmin', 'u', 'v'):
+                continue
+            for year, filename in sorted(maca_files(catalog, v, scenario).items()):
+                outputs = [output_file(MACA_vars[v][4], scenario, year)]
+                if out_of_date(outputs, [filename], written):
+                    tasks.append((outputs, [filename], convert_file, v, scenario, year, filename))
+        # The maximum and minimum relative humidity, and the u and v wind, are matched by year
+        rhmax_files, rhmin_files = maca_files(catalog, 'rhmax', scenario), maca_files(catalog, 'rhmin', scenario)
+        for year in sorted(set(rhmax_files) & set(rhmin_files)):
+            outputs = [output_file(ave_relh_file, scenario, year)]
+            if write_min_max_relh:
+                outputs = outputs + [output_file(MACA_vars[v][4], scenario, year) for v in ('rhmax', 'rhmin')]
+            sources = [rhmax_files[year], rhmin_files[year]]
+            if out_of_date(outputs, sources, written):
+                tasks.append((outputs, sources, convert_relh, scenario, year, rhmax_files[year], rhmin_files[year]))
+        u_files, v_files = maca_files(catalog, 'u', scenario), maca_files(catalog, 'v', scenario)
+        for year in sorted(set(u_files) & set(v_files)):
+            outputs = [output_file(wspd_file, scenario, year)]
+            if write_u_v:
+                outputs = outputs + [output_file(MACA_vars[v][4], scenario, year) for v in ('u', 'v')]
+            sources = [u_files[year], v_files[year]]
+            if out_of_date(outputs, sources, written):
+                tasks.append((outputs, sources, convert_wind, scenario, year, u_files[year], v_files[year]))
+    print(str(len(tasks)) + ' files to convert')
+
+    # Create the output folders if they do not exist
+    for scenario in MACA_scenarios:
+        patterns = [MACA_vars[v][4] for v in MACA_vars if (write_u_v or v not in ('u', 'v')) and (write_min_max_relh or v not in ('rhmax', 'rhmin'))]
+        patterns = patterns + [ave_relh_file, wspd_file]
+        for pattern in patterns:
+            os.makedirs(os.path.dirname(output_file(pattern, scenario, 0)), exist_ok=True)
+
+    # The settings of each task's output files are saved as soon as it finishes, and again if the run stops part way
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(*task[2:]) for task in tasks]
+                for task, future in zip(tasks, futures):
+                    future.result()
+                    written.update({f: conversion_settings(task[1]) for f in task[0]})
+        else:
+            for task in tasks:
+                task[2](*task[3:])
+                written.update({f: conversion_settings(task[1]) for f in task[0]})
+    finally:
+        save_outputs(written)
@@ -0,0 +1,59 @@
+import os
+import sys
+import subprocess
+import pandas as pd
+
+# This is a Python script that checks how fast Convert_Maca_Daily_to_IBIS.py starts. Every worker process of the converter loads the
+# script and its modules again before it converts anything, so slow imports slow down every run. It imports the script in a new Python
+# process (importing it does not convert anything), the way a worker process does, and compares the time with a new Python process that
+# only imports the modules every run needs. It also checks that none of the modules only some runs need (or that are not used at all)
+# are loaded by the import, and fails if one is, or if the import takes longer than max_seconds.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# Inputs to change
+script = 'Convert_Maca_Daily_to_IBIS' # Script to check, in the same directory as this one
+repeats = 5 # Each time is the best of this many new processes
+max_seconds = 5 # The check fails if importing the script takes longer than this
+optional_modules = ['xesmf', 'scipy', 'dask', 'cartopy', 'matplotlib', 'metpy'] # Modules the import should not load
+
+
+# Python code run in each new process: it imports modules and prints how long that took and the optional modules that were loaded
+timer = """
+import sys, time
+start = time.perf_counter()
+{imports}
+print(time.perf_counter() - start)
+print(','.join(m for m in {optional} if m in sys.modules))
+"""
+
+# This function imports modules in repeats new Python processes, run in the directory of this script, and returns the best time
+# and the optional modules that were loaded
+def import_time(imports):
+    code = timer.format(imports=imports, optional=optional_modules)
+    times = []
+    for r in range(repeats):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            sys.exit(result.stderr)
+        seconds, loaded = result.stdout.splitlines()[-2:]
+        times.append(float(seconds))
+    return min(times), [m for m in loaded.split(',') if m]
+
+if __name__ == '__main__':
+    results = []
+    for name, imports in [('required modules', 'import numpy, pandas, xarray, netCDF4'), (script, 'import ' + script)]:
+        seconds, loaded = import_time(imports)
+        results.append({'import': name, 'time (s)': round(seconds, 3), 'optional modules loaded': ', '.join(loaded) or 'none'})
+    results = pd.DataFrame(results).set_index('import')
+    print(results.to_string())
+
+    # seconds and loaded are from the script, the last import
+    failed = []
+    if loaded:
+        failed.append(script + ' loads ' + ', '.join(loaded) + ' when it is imported')
+    if seconds > max_seconds:
+        failed.append(script + ' takes ' + str(round(seconds, 2)) + ' s to import, more than ' + str(max_seconds) + ' s')
+    if failed:
+        sys.exit('Startup check failed: ' + '; '.join(failed))
+    print('Startup check passed')
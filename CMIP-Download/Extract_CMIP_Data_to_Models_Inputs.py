@@ -26,8 +26,9 @@ import numpy as np
 import xarray as xr
 import pandas as pd
 import calendar
-import datetime
 from multiprocessing import Pool, cpu_count
+from dayCentWriter import daycent_block, write_daycent
+from agroIBISWriter import write_agroibis
 
 # Define the necessary variables used in the code
 wor_dir = '/work/hdd/bbkc/langzhou/CMIP_to_Model_Inputs/'                   # Directory where the project locates
@@ -85,116 +86,111 @@ generated_Daycent_climate_dir = os.path.join(wor_dir, generated_climate_dir, 'ge
 if not os.path.exists(generated_Daycent_climate_dir):
     os.makedirs(generated_Daycent_climate_dir, exist_ok=True)
 Daycent_weather_prefix = 'DayCent_weather_'
+Daycent_variables = ['tasmax', 'tasmin', 'pr', 'rsds', 'hurs', 'sfcWind']  # CMIP variables in the order of the DayCent weather columns
+Daycent_decimals = [2, 2, 2, 4, 2, 4]                                    # Decimals written for each of them
 generated_AgroIBIS_climate_dir = os.path.join(wor_dir, generated_climate_dir, 'generated_AgroIBIS_climate_data')
+AgroIBIS_output_profile = 'classic'  # How the AgroIBIS files are stored: 'classic' (uncompressed doubles), 'zlib_day', 'zlib_cell' or 'zlib_cell_float32'. See agroIBISWriter.py
 if not os.path.exists(generated_AgroIBIS_climate_dir):
     os.makedirs(generated_AgroIBIS_climate_dir, exist_ok=True)
     
+# The extracted data of all the experiments, sites, variables and days is one array of doubles, stored in this file and memory-mapped
+# by the parallel workers, which each write the part of their file into it, and by the functions writing the model inputs.
+# Its shape is (number_of_experiments, number_of_sites, len(variables), number of days from start_year to end_year with the leap days)
+CMIP_data_file = os.path.join(wor_dir, 'Extracted_CMIP_data.dat')
+
+# This function returns the index of January 1 of year along the day dimension of the extracted data
+def day_index(year):
+    return (pd.Timestamp(year=year, month=1, day=1) - pd.Timestamp(year=start_year, month=1, day=1)).days
+
+# This function returns the shape of the extracted data
+def CMIP_data_shape():
+    return (len(experiment_IDs), number_of_sites, len(variables), day_index(end_year + 1))
+
 # This is the function that each worker will run for a specific task.
-# each worker will read the CMIP data for a specific site, experiment, variable, and time interval
+# each worker will read the CMIP data of one file, for a specific experiment, variable, and time interval, at all the sites
 # e.g., hurs_day_CESM2_ssp245_r10i1p1f1_gn_20150101-20241231.nc
-# It returns the data for that site, experiment, variable, time interval (start year and end year), and the data itself.
-# The data is a np array with length of time interval (number of years in that interval), 
-# and each element is a xr.DataArray object for that variables in a year, e.g., tasmax for 2015, tasmax for 2016, ..., tasmax for 2024
+# The file is opened once, and the grid cells nearest to all the sites are read with one pointwise selection along a new site dimension.
+# The daily values of every site, with Feb 29 added in leap years, are written into its part of CMIP_data_file.
+# It returns the experiment, variable, time interval (start year and end year), and the metadata of the file: the attributes of the variable,
+# the latitudes and longitudes of the grid cells of the sites with their attributes, and the other coordinates with a single value
+# (e.g., the height of tasmax) (None if the file could not be read)
 def read_CMIP_data_worker(args):
-    site_idx, exp_idx, var_idx, cur_interval_start, cur_interval_end, file_path = args
+    exp_idx, var_idx, cur_interval_start, cur_interval_end, file_path = args
     if not os.path.exists(file_path):
         raise FileNotFoundError(f'Source file {file_path} does not exist.')
     var = variables[var_idx]
-    cur_interval_data = np.empty((cur_interval_end-cur_interval_start+1), dtype=object)
     try:
-        lon = lons[site_idx] if lons[site_idx] >= 0 else lons[site_idx] + 360 # adjust longitude for negative values
-        lat = lats[site_idx]
+        site_lons = xr.DataArray([lon if lon >= 0 else lon + 360 for lon in lons], dims='site') # adjust longitude for negative values
+        site_lats = xr.DataArray(lats, dims='site')
         with xr.open_dataset(file_path, engine='netcdf4') as temp:
-            cropped_data = temp.sel(lat=lat, lon=lon, method='nearest')
-            if 'lev' not in cropped_data.dims:
-                cropped_data = cropped_data.expand_dims('lev')
-            cropped_data = cropped_data.assign_coords(lev = [1])
-            cropped_data[var] = cropped_data[var].astype('double')
-            if var in ['tasmax', 'tasmin']:
-                cropped_data[var] = cropped_data[var] - 273.15 # convert Kelvin to Celsius
-            elif var == 'pr':
-                cropped_data[var] = cropped_data[var] * 86400  # convert from mm/s to mm/day
-            elif var == 'hurs':
-                cropped_data[var] = cropped_data[var].where(cropped_data[var] <= 100, 100) # set the up bound of hurs to 100%
-            cropped_data[var].attrs["units"] = units_map[var]
-            if 'nbnd' in cropped_data.dims:
-                vars_with_nbnd = [v for v in cropped_data.data_vars if 'nbnd' in cropped_data[v].dims]
-                cropped_data = cropped_data.drop_vars(vars_with_nbnd)
-            cropped_data = cropped_data.transpose("time", "lev")
-            # extract each year's var data
-            grouped_data = cropped_data.groupby('time.year')
-            for year in range(cur_interval_start, cur_interval_end + 1):
-                if year not in grouped_data.groups:
-                    raise ValueError(f"Year {year} not found in dataset.")
-                yearly_data = cropped_data.isel(time=grouped_data.groups[year])
-                # Convert cftime no-leap dates to pandas timestamps (standard calendar)
-                old_times = yearly_data.time.values
-                new_times = []
-                for old_time in old_times:
-                    # Extract year, month, day from cftime object
-                    new_time = pd.Timestamp(year=old_time.year, month=old_time.month, day=old_time.day)
-                    new_times.append(new_time)
-                # Create new dataset with standard calendar timestamps
-                yearly_data_standard = yearly_data.copy()
-                yearly_data_standard = yearly_data_standard.assign_coords(time=new_times)
-                # If it's a leap year, add Feb 29
-                if calendar.isleap(year):
-                    # Find Feb 28 and Mar 1 positions
-                    val_feb_28 = yearly_data_standard[var].isel(time=58)
-                    val_mar_01 = yearly_data_standard[var].isel(time=59)
-                    avg_val = 0.5 * (val_feb_28 + val_mar_01)
-                    # Create Feb 29 timestamp
-                    feb_29_time = pd.Timestamp(year=year, month=2, day=29)
-                    # Create a single-day dataset for Feb 29
-                    feb_29_data = yearly_data_standard.isel(time=58)  # Use Feb 28 as template
-                    feb_29_data = feb_29_data.expand_dims('time')
-                    feb_29_data = feb_29_data.assign_coords(time=[feb_29_time])
-                    feb_29_data[var] = feb_29_data[var] * 0 + avg_val  # Replace data with avg_val
-                    # Combine original yearly data with Feb 29 data
-                    yearly_data_with_leap = xr.concat([yearly_data_standard, feb_29_data], dim='time')
-                    yearly_data_with_leap = yearly_data_with_leap.sortby('time')
-                    cur_interval_data[year - cur_interval_start] = yearly_data_with_leap
-                else:
-                    cur_interval_data[year - cur_interval_start] = yearly_data_standard
-        return (site_idx, exp_idx, var_idx, cur_interval_start, cur_interval_end, cur_interval_data)
+            cropped_data = temp[var].sel(lat=site_lats, lon=site_lons, method='nearest').load()
+        metadata = {'attrs': dict(cropped_data.attrs, units=units_map[var]),
+                    'lat': cropped_data.lat.values, 'lat_attrs': cropped_data.lat.attrs,
+                    'lon': cropped_data.lon.values, 'lon_attrs': cropped_data.lon.attrs,
+                    'scalar_coords': {k: ((), c.values, c.attrs) for k, c in cropped_data.coords.items() if c.dims == ()}}
+        cropped_data = cropped_data.astype('double')
+        if var in ['tasmax', 'tasmin']:
+            cropped_data = cropped_data - 273.15 # convert Kelvin to Celsius
+        elif var == 'pr':
+            cropped_data = cropped_data * 86400  # convert from mm/s to mm/day
+        elif var == 'hurs':
+            cropped_data = cropped_data.where(cropped_data <= 100, 100) # set the up bound of hurs to 100%
+        cropped_data = cropped_data.squeeze([d for d in cropped_data.dims if d not in ('time', 'site')]).transpose('time', 'site')
+        # extract each year's var data (the CMIP dates are in a no-leap calendar)
+        years = cropped_data.time.dt.year.values
+        cur_interval_data = []
+        for year in range(cur_interval_start, cur_interval_end + 1):
+            if year not in years:
+                raise ValueError(f"Year {year} not found in dataset.")
+            yearly_data = cropped_data.values[years == year]
+            # If it's a leap year, add Feb 29 as the average of Feb 28 and Mar 1
+            if calendar.isleap(year):
+                yearly_data = np.insert(yearly_data, 59, 0.5 * (yearly_data[58] + yearly_data[59]), axis=0)
+            cur_interval_data.append(yearly_data)
+        CMIP_data = np.memmap(CMIP_data_file, dtype='double', mode='r+', shape=CMIP_data_shape())
+        CMIP_data[exp_idx, :, var_idx, day_index(cur_interval_start):day_index(cur_interval_end + 1)] = np.concatenate(cur_interval_data).T
+        CMIP_data.flush()
+        return (exp_idx, var_idx, cur_interval_start, cur_interval_end, metadata)
     except Exception as e:
-        print(f"Error processing {file_path} for site {site_idx}: {e}")
+        print(f"Error processing {file_path}: {e}")
         print(traceback.format_exc())
-        return (site_idx, exp_idx, var_idx, cur_interval_start, cur_interval_end, np.array([]))
+        return (exp_idx, var_idx, cur_interval_start, cur_interval_end, None)
 
 # This sets up and runs the parallel job
-# The function returns a 4D array of shape (number_of_experiments, number_of_sites, number_of_years, len(variables)
-# Each element represents the climate data (a xr.DataArray object) for a particular experiment, site, year, and variable
+# There is one task for each CMIP file (experiment, time interval and variable), which reads all the sites
+# The function returns the extracted data, a 4D array of doubles of shape (number_of_experiments, number_of_sites, len(variables), number of days)
+# memory-mapped from CMIP_data_file (NaN where a file could not be read), and the metadata of each variable (see read_CMIP_data_worker)
 def extract_CMIP_data_parallel():
-    num_years = end_year - start_year + 1
-    CMIP_data = np.empty((len(experiment_IDs), number_of_sites, num_years, len(variables)), dtype=object)
+    size_GB = np.prod(CMIP_data_shape()) * 8 / 1e9
+    print(f'Extracting CMIP data into {CMIP_data_file}: {size_GB:.2f} GB for {CMIP_data_shape()} (experiments, sites, variables, days)')
+    CMIP_data = np.memmap(CMIP_data_file, dtype='double', mode='w+', shape=CMIP_data_shape())
+    CMIP_data[:] = np.nan
+    CMIP_data.flush()
+    CMIP_metadata = [None] * len(variables)
     # Step 1: Create task list
     tasks = []
     for exp_idx, exp_id in enumerate(experiment_IDs):
-        for site_idx in range(number_of_sites):
-            for year in range(start_year, end_year + 1, year_interval):
-                year_idx = (year - start_year) // year_interval
-                cur_interval_start = start_year + year_idx * year_interval
-                cur_interval_end = cur_interval_start + year_interval - 1
-                suffix = f'{cur_interval_start}0101-{cur_interval_end}1231' if cur_interval_end <= end_year else f'{cur_interval_start}0101-{end_year+1}0101'
-                for var_idx, var in enumerate(variables):
-                    file_name = f'{var}_{frequency}_{source_ID}_{exp_id}_{variant_label}_{grid_label}_{suffix}.nc'
-                    file_path = os.path.join(downloaded_CMIP_source_dir, file_name)
-                    tasks.append((site_idx, exp_idx, var_idx, cur_interval_start, min(cur_interval_end, end_year), file_path))
-    # Step 2: Run in parallel to read CMIP data
+        for year in range(start_year, end_year + 1, year_interval):
+            year_idx = (year - start_year) // year_interval
+            cur_interval_start = start_year + year_idx * year_interval
+            cur_interval_end = cur_interval_start + year_interval - 1
+            suffix = f'{cur_interval_start}0101-{cur_interval_end}1231' if cur_interval_end <= end_year else f'{cur_interval_start}0101-{end_year+1}0101'
+            for var_idx, var in enumerate(variables):
+                file_name = f'{var}_{frequency}_{source_ID}_{exp_id}_{variant_label}_{grid_label}_{suffix}.nc'
+                file_path = os.path.join(downloaded_CMIP_source_dir, file_name)
+                tasks.append((exp_idx, var_idx, cur_interval_start, min(cur_interval_end, end_year), file_path))
+    # Step 2: Run in parallel to read CMIP data into CMIP_data_file
     with Pool() as pool:
         results = pool.map(read_CMIP_data_worker, tasks)
-    # Step 3: Fill CMIP_data array
-    for site_idx, exp_idx, var_idx, cur_interval_start, cur_interval_end, data in results:
-        if data is None or len(data) == 0:
-            continue
-        try:
-            start_year_idx = cur_interval_start - start_year
-            end_year_idx = cur_interval_end - start_year
-            CMIP_data[exp_idx, site_idx, start_year_idx : end_year_idx+1, var_idx] = data
-        except Exception as e:
-            print(f"[ERROR] Failed to store data: {e}")
-    return CMIP_data
+    # Step 3: Stop before any model inputs are written if a file could not be read, since its part of CMIP_data is still NaN
+    failed = [task[4] for task, result in zip(tasks, results) if result[4] is None]
+    if failed:
+        raise RuntimeError(f'{len(failed)} CMIP files could not be read (see the errors above): ' + ', '.join(failed))
+    # Step 4: Keep the metadata of each variable
+    for exp_idx, var_idx, cur_interval_start, cur_interval_end, metadata in results:
+        if CMIP_metadata[var_idx] is None:
+            CMIP_metadata[var_idx] = metadata
+    return CMIP_data, CMIP_metadata
 
 # This function calculates the time of solar noon for a given longitude and latitude
 # used for the Ecosys inputs
@@ -224,15 +220,11 @@ def convert_CMIP_data_into_Ecosys_model_inputs(CMIP_data, generated_Ecosys_clima
                     [10, 0, ZNOONG],
                     [7, 0.25, 0.3, 0.05, 0, 0, 0, 0, 0, 0, 0, 0]
                 ]
-                cur_year_climate_data = CMIP_data[exp_idx, site_idx, year-start_year]
                 n_days = 366 if calendar.isleap(year) else 365
                 year_col = [year] * n_days
                 doy_col = [doy+1 for doy in range(0, n_days)]
-                # Extract daily values for each climate variable
-                climate_data_cols = []
-                for var_idx, var in enumerate(variables):
-                    cur_climate_var_data = cur_year_climate_data[var_idx][var].values
-                    climate_data_cols.append(cur_climate_var_data)
+                # Daily values for each climate variable, in the order of variables
+                climate_data_cols = CMIP_data[exp_idx, site_idx, :, day_index(year):day_index(year + 1)]
                 # Transpose to rows: each row is [year, doy, 'tasmax', 'tasmin', 'hurs', 'sfcWind', 'pr', 'rsds']
                 rows = []
                 for i in range(n_days):
@@ -250,21 +242,26 @@ def convert_CMIP_data_into_Ecosys_model_inputs(CMIP_data, generated_Ecosys_clima
                     writer.writerows(headers)
                     writer.writerows(rows)
 
-# This function take the CMIP_data as input, and convert it into AgroIBIS model inputs
-def convert_CMIP_data_into_AgroIBIS_model_inputs(CMIP_data, generated_AgroIBIS_climate_dir):
+# This function take the CMIP_data and CMIP_metadata as input, and convert it into AgroIBIS model inputs
+def convert_CMIP_data_into_AgroIBIS_model_inputs(CMIP_data, CMIP_metadata, generated_AgroIBIS_climate_dir):
     for exp_idx, exp_id in enumerate(experiment_IDs):
         for site_idx in range(number_of_sites):
             exp_site_dir = os.path.join(generated_AgroIBIS_climate_dir, exp_id, f'site_{site_idx+1}')
             if not os.path.exists(exp_site_dir):
                 os.makedirs(exp_site_dir)
             for year in range(start_year, end_year + 1):
-                cur_year_climate_data = CMIP_data[exp_idx, site_idx, year-start_year]
+                days = pd.date_range(f'{year}-01-01', f'{year}-12-31')
                 for var_idx, var in enumerate(variables):
                     var_AgroIBIS = var_to_AgroIBIS_map[var]
                     outfile = os.path.join(exp_site_dir, f'{var_AgroIBIS}_{year}.nc')
-                    cur_climate_var_data = cur_year_climate_data[var_idx]
-                    cur_climate_var_data = cur_climate_var_data.rename({var : var_AgroIBIS})
-                    cur_climate_var_data[[var_AgroIBIS, 'time', 'lev', 'lat', 'lon']].to_netcdf(outfile, format = "NETCDF4_CLASSIC")
+                    metadata = CMIP_metadata[var_idx]
+                    values = CMIP_data[exp_idx, site_idx, var_idx, day_index(year):day_index(year + 1)]
+                    cur_climate_var_data = xr.Dataset({var_AgroIBIS: (('time', 'lev'), values[:, None], metadata['attrs'])},
+                                                      coords={'time': days, 'lev': [1],
+                                                              'lat': ((), metadata['lat'][site_idx], metadata['lat_attrs']),
+                                                              'lon': ((), metadata['lon'][site_idx], metadata['lon_attrs']),
+                                                              **metadata['scalar_coords']})
+                    write_agroibis(cur_climate_var_data, outfile, AgroIBIS_output_profile)
 
 # This function take the CMIP_data as input, and convert it into Daycent model inputs
 def convert_CMIP_data_into_Daycent_model_inputs(CMIP_data, generated_Daycent_climate_dir):
@@ -277,31 +274,19 @@ def convert_CMIP_data_into_Daycent_model_inputs(CMIP_data, generated_Daycent_cli
                 os.makedirs(exp_site_dir)
             for year in range(start_year, end_year + 1):
                 weather_file = os.path.join(exp_site_dir, f'{Daycent_weather_prefix}{year}.txt')
-                cur_year_climate_data = CMIP_data[exp_idx, site_idx, year-start_year]
-                n_days = 366 if calendar.isleap(year) else 365
-                rows = []
-                for i in range(n_days):
-                    date = datetime.datetime(year, 1, 1) + datetime.timedelta(days=i)
-                    month = date.month
-                    day = date.day
-                    doy = i + 1
-                    row = [day, month, year, doy,   # 'tasmax', 'tasmin', 'pr', 'rsds', 'hurs', 'sfcWind'
-                           round(cur_year_climate_data[0]['tasmax'].values[i].item(), 2),
-                           round(cur_year_climate_data[1]['tasmin'].values[i].item(), 2),
-                           round(cur_year_climate_data[4]['pr'].values[i].item(), 2),
-                           round(cur_year_climate_data[5]['rsds'].values[i].item(), 4),
-                           round(cur_year_climate_data[2]['hurs'].values[i].item(), 2),
-                           round(cur_year_climate_data[3]['sfcWind'].values[i].item(), 4)]
-                    rows.append(row)
-                df = pd.DataFrame(rows)
-                df.to_csv(weather_file, sep='\t', index=False, header=False)
+                cur_year_climate_data = CMIP_data[exp_idx, site_idx, :, day_index(year):day_index(year + 1)]
+                days = pd.date_range(f'{year}-01-01', f'{year}-12-31')
+                # Build the whole year as one days x 10 block and write it in one call (see dayCentWriter.py)
+                columns = [cur_year_climate_data[variables.index(var)] for var in Daycent_variables]
+                write_daycent(weather_file, daycent_block(days, *columns), decimals=Daycent_decimals)
 
 if __name__ == '__main__':
-    CMIP_data = extract_CMIP_data_parallel()
-    ## save the data to a file
-    # np.save(os.path.join(wor_dir, 'Extracted_CMIP_data.npy'), CMIP_data)
-    ## load the data from a file
-    # CMIP_data = np.load(os.path.join(wor_dir, 'Extracted_CMIP_data.npy'), allow_pickle=True)
+    CMIP_data, CMIP_metadata = extract_CMIP_data_parallel()
+    ## the data stays in CMIP_data_file, save the metadata to a file as well
+    # np.save(os.path.join(wor_dir, 'Extracted_CMIP_metadata.npy'), CMIP_metadata)
+    ## load the data from the files
+    # CMIP_data = np.memmap(CMIP_data_file, dtype='double', mode='r', shape=CMIP_data_shape())
+    # CMIP_metadata = list(np.load(os.path.join(wor_dir, 'Extracted_CMIP_metadata.npy'), allow_pickle=True))
     convert_CMIP_data_into_Ecosys_model_inputs(CMIP_data, generated_Ecosys_climate_dir)
-    convert_CMIP_data_into_AgroIBIS_model_inputs(CMIP_data, generated_AgroIBIS_climate_dir)
+    convert_CMIP_data_into_AgroIBIS_model_inputs(CMIP_data, CMIP_metadata, generated_AgroIBIS_climate_dir)
     convert_CMIP_data_into_Daycent_model_inputs(CMIP_data, generated_Daycent_climate_dir)
\ No newline at end of file
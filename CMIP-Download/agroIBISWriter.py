@@ -0,0 +1,75 @@
+import os
+
+# This is a Python module that writes AgroIBIS netCDF files with an output profile. It is used by gridMetAgroIBIS.py, by
+# Convert_Maca_Daily_to_IBIS.py and by Extract_CMIP_Data_to_Models_Inputs.py, which keep a copy of it in their own folders.
+# The main copy is AgroIBIS/GridMet/agroIBISWriter.py: make changes there and copy the file over
+# AgroIBIS/MACA/agroIBISWriter.py and CMIP-Download/agroIBISWriter.py, so the three stay the same.
+# A profile sets how the weather variable of each file is stored:
+# complevel: zlib compression level from 1 to 9, or 0 to not compress
+# shuffle: shuffle the bytes of the values before compressing them, which makes them compress better
+# chunking: 'cell' stores all the days of a small block of grid cells together, which is fast to read the time series of a cell
+#           (the way AgroIBIS reads its inputs), 'day' stores the whole grid of each day together, which is fast to read maps of a day,
+#           and None leaves the netCDF defaults
+# float32: store the values as 4 byte floats instead of doubles. GridMet and MACA values have float precision to begin with
+# 'classic' writes the uncompressed doubles the scripts have always written.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+AgroIBIS_profiles = {
+    'classic': {'complevel': 0, 'shuffle': False, 'chunking': None, 'float32': False},
+    'zlib_day': {'complevel': 4, 'shuffle': True, 'chunking': 'day', 'float32': False},
+    'zlib_cell': {'complevel': 4, 'shuffle': True, 'chunking': 'cell', 'float32': False},
+    'zlib_cell_float32': {'complevel': 4, 'shuffle': True, 'chunking': 'cell', 'float32': True},
+}
+
+# Number of grid cells along lat and along lon in one chunk with 'cell' chunking
+cell_block = 16
+
+# This function returns the settings of a profile. profile is the name of one of AgroIBIS_profiles, or a dictionary with
+# the settings to change from 'classic', for example {'complevel': 1, 'shuffle': True}
+def agroibis_profile(profile='classic'):
+    if isinstance(profile, dict):
+        settings = dict(AgroIBIS_profiles['classic'])
+        settings.update(profile)
+        return settings
+    if profile not in AgroIBIS_profiles:
+        raise ValueError('Unknown AgroIBIS output profile ' + str(profile) + ', use one of ' + ', '.join(AgroIBIS_profiles))
+    return AgroIBIS_profiles[profile]
+
+# This function returns the chunk shape of a variable with the given dimensions and sizes for a chunking of 'cell' or 'day'
+def agroibis_chunks(dims, sizes, chunking):
+    chunks = []
+    for dim, size in zip(dims, sizes):
+        if dim == 'time':
+            chunks.append(size if chunking == 'cell' else 1)
+        elif dim in ('lat', 'lon'):
+            chunks.append(min(size, cell_block) if chunking == 'cell' else size)
+        else:
+            chunks.append(1)
+    return tuple(max(c, 1) for c in chunks)
+
+# This function returns the encoding passed to to_netcdf for the weather variables of data (the data variables with a time
+# dimension). It is empty for 'classic', so those files are written exactly as before
+def agroibis_encoding(data, profile='classic'):
+    settings = agroibis_profile(profile)
+    encoding = {}
+    for name, var in data.data_vars.items():
+        if 'time' not in var.dims:
+            continue
+        enc = {}
+        if settings['complevel']:
+            enc.update({'zlib': True, 'complevel': int(settings['complevel']), 'shuffle': bool(settings['shuffle'])})
+        if settings['chunking']:
+            enc['chunksizes'] = agroibis_chunks(var.dims, var.shape, settings['chunking'])
+        if settings['float32']:
+            enc['dtype'] = 'float32'
+        if enc:
+            encoding[name] = enc
+    return encoding
+
+# This function writes an AgroIBIS dataset to outfile with the profile. format is passed to to_netcdf
+# (NETCDF4_CLASSIC files can be compressed and chunked as well). The file is written as outfile.part and renamed when it is complete,
+# so a run that is stopped part way never leaves a file that looks finished
+def write_agroibis(data, outfile, profile='classic', format='NETCDF4_CLASSIC'):
+    data.to_netcdf(outfile + '.part', format=format, encoding=agroibis_encoding(data, profile))
+    os.replace(outfile + '.part', outfile)
+    return outfile
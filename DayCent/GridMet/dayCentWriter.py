@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+
+# This is a Python module that writes DayCent weather files. It is used by gridMetDayCent.py and by
+# Extract_CMIP_Data_to_Models_Inputs.py, which keeps a copy of it in the CMIP-Download folder.
+# The main copy is DayCent/GridMet/dayCentWriter.py: make changes there and copy the file over
+# CMIP-Download/dayCentWriter.py, so the two stay the same.
+# A DayCent weather file has one line per day with 10 tab-separated columns:
+# day, month, year, day of year, max temperature, min temperature, precipitation, solar radiation, relative humidity, wind speed
+# The whole block of days x 10 columns is formatted in one call with a fixed number of decimals per column, instead of
+# going row by row or through a DataFrame, and each file is written with a single buffered write.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# Columns of the DayCent weather file, in order
+DayCent_columns = ['day', 'month', 'year', 'doy', 'tmax', 'tmin', 'prec', 'rads', 'relh', 'wspd']
+
+# This function returns the days x 10 block of one DayCent weather table as a float array.
+# days is a pandas DatetimeIndex (or anything pd.DatetimeIndex accepts) and the six weather variables are 1D arrays of the same length
+def daycent_block(days, tmax, tmin, prec, rads, relh, wspd):
+    days = pd.DatetimeIndex(days)
+    block = np.empty((len(days), len(DayCent_columns)), dtype='double')
+    block[:, 0] = days.day
+    block[:, 1] = days.month
+    block[:, 2] = days.year
+    block[:, 3] = days.dayofyear
+    for j, values in enumerate([tmax, tmin, prec, rads, relh, wspd]):
+        block[:, 4 + j] = values
+    return block
+
+# This function returns the number of decimals of each of the six weather variables. decimals is one number for all of them,
+# or a list with one number per variable
+def daycent_decimals(decimals=4):
+    if np.ndim(decimals) == 0:
+        return [int(decimals)] * 6
+    return [int(d) for d in decimals]
+
+# This function returns the format of one line
+def daycent_line_format(decimals=4):
+    return '\t'.join(['%d'] * 4 + ['%.' + str(d) + 'f' for d in daycent_decimals(decimals)]) + '\n'
+
+# This function formats one or more days x 10 blocks as the text of a DayCent weather file
+def format_daycent(blocks, decimals=4):
+    if isinstance(blocks, np.ndarray) and blocks.ndim == 2:
+        blocks = [blocks]
+    block = np.concatenate(blocks, axis=0) if len(blocks) > 1 else np.asarray(blocks[0])
+    values = np.array(block, dtype='double')
+    # Round first so values that round to zero are not written as -0.0000
+    for j, d in enumerate(daycent_decimals(decimals)):
+        values[:, 4 + j] = np.round(values[:, 4 + j], d) + 0.0
+    return (daycent_line_format(decimals) * len(values)) % tuple(values.ravel().tolist())
+
+# This function writes one DayCent weather file. blocks is one days x 10 block, or a list of blocks (for example
+# several years of the same site) that are written one after the other in the same file.
+# With append=True the lines are added to the end of an existing file instead
+def write_daycent(file, blocks, decimals=4, append=False):
+    text = format_daycent(blocks, decimals)
+    with open(file, 'a' if append else 'w', buffering=max(len(text), 1)) as f:
+        f.write(text)
+    return file
+
+# This function returns the day of year on the last line of a DayCent weather file, which is the number of days already
+# written for a file of one year. It returns 0 if the file does not exist or is empty
+def daycent_last_doy(file):
+    if not os.path.exists(file):
+        return 0
+    with open(file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 512, 0))
+        lines = f.read().splitlines()
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return 0
+    return int(float(lines[-1].split()[3]))
+
+# This function returns a DataFrame with the DayCent columns for a days x 10 block, for scripts that want the table instead of a file
+def daycent_frame(block):
+    frame = pd.DataFrame(block, columns=DayCent_columns)
+    return frame.astype({'day': int, 'month': int, 'year': int, 'doy': int})
@@ -0,0 +1,90 @@
+import time
+import sqlite3
+import calendar
+import numpy as np
+
+# This is a Python module that keeps a local cache of the daily GridMet series already pulled out for single grid cells.
+# Each entry is keyed by (GridMet variable, year, lat_idx, lon_idx), where the indices are the position of the cell on the
+# full GridMet CONUS grid (see gridMetSiteIndex.py), so sites that fall in the same 4 km cell share one entry. The raw values read from the netCDF
+# file are stored as compact arrays in one SQLite file, so a rerun for the same or neighbouring sites does not have to
+# open the yearly netCDF files again. When the cache grows over its disk budget the least recently used entries are removed.
+# Only complete years are cached, because GridMet keeps adding days to the current year.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# This class stores and looks up the series of single grid cells for a GridMet variable and year
+class GridMetCache:
+
+    # With auto_evict=False, put() does not remove entries to stay within the budget, and evict() has to be called later
+    # (used while several processes read and write the same cache)
+    def __init__(self, file, size_mb=1024, auto_evict=True):
+        self.file = file
+        self.budget = int(size_mb * 1024 * 1024)
+        self.auto_evict = auto_evict
+        self.db = sqlite3.connect(file, timeout=60)
+        self.db.execute('CREATE TABLE IF NOT EXISTS series (var TEXT, year INTEGER, lat_idx INTEGER, lon_idx INTEGER, '
+                        'start TEXT, dtype TEXT, data BLOB, nbytes INTEGER, used REAL, PRIMARY KEY (var, year, lat_idx, lon_idx))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS series_used ON series (used)')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    # This function returns the cells of a variable and year that are not in the cache yet
+    def missing(self, v, y, cells):
+        rows = self.db.execute('SELECT lat_idx, lon_idx FROM series WHERE var = ? AND year = ?', (v, y)).fetchall()
+        have = set(rows)
+        return [cell for cell in dict.fromkeys(cells) if cell not in have]
+
+    # This function returns the first day of the series and a dictionary of {(lat_idx, lon_idx): array} for the cells found.
+    # The first day is None if none of the cells are cached.
+    def get(self, v, y, cells):
+        found = {}
+        start = None
+        for lat_idx, lon_idx in dict.fromkeys(cells):
+            row = self.db.execute('SELECT start, dtype, data FROM series WHERE var = ? AND year = ? AND lat_idx = ? AND lon_idx = ?',
+                                  (v, y, lat_idx, lon_idx)).fetchone()
+            if row is None:
+                continue
+            start = row[0]
+            found[(lat_idx, lon_idx)] = np.frombuffer(row[2], dtype=row[1])
+        if found:
+            now = time.time()
+            self.db.executemany('UPDATE series SET used = ? WHERE var = ? AND year = ? AND lat_idx = ? AND lon_idx = ?',
+                                [(now, v, y) + cell for cell in found])
+            self.db.commit()
+        return start, found
+
+    # This function stores the series of each cell, given as the columns of values, if the year is complete
+    def put(self, v, y, cells, days, values):
+        if len(days) != (366 if calendar.isleap(y) else 365):
+            return
+        start = days[0].strftime('%Y-%m-%d')
+        now = time.time()
+        rows = []
+        for j, (lat_idx, lon_idx) in enumerate(cells):
+            series = np.ascontiguousarray(values[:, j])
+            rows.append((v, y, int(lat_idx), int(lon_idx), start, series.dtype.str, series.tobytes(), series.nbytes, now))
+        self.db.executemany('INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+        if self.auto_evict:
+            self.evict()
+
+    # This function removes the least recently used entries until the cache is within its disk budget
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM series').fetchone()[0]
+        if total <= self.budget:
+            return
+        removed = 0
+        for rowid, nbytes in self.db.execute('SELECT rowid, nbytes FROM series ORDER BY used').fetchall():
+            if total - removed <= self.budget:
+                break
+            self.db.execute('DELETE FROM series WHERE rowid = ?', (rowid,))
+            removed += nbytes
+        self.db.commit()
+        self.db.execute('VACUUM')
@@ -1,198 +1,308 @@
-import os
-import sys
-import wget
-import xarray as xr
-import netCDF4
-import numpy as np
-import pandas as pd
-
-# This is a Python script that will download minimum temperature, maximum temperature, precipitation, solar radiation, wind speed, and relative humidity.
-# # It will then process the data so it is in the netCDF format needed to be input in DayCent. It is customizable based on the years and spatial domain needed. Also the directory you want to download the data into 
-# is an input. 
-# This was developed off a script provided by Theo Hartman from the Heaton Lab at Illinois. 
-# For questions, email Leslie Stoecker, lensor@illinois.edu 
-
-# Get the arguments passed through command line - uncomment if using 
-syr, eyr, latitude, longitude, dir, locations, delim = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6], sys.argv[7]
-
-# Inputs to change for only a single latitude/longitude point. Remove the # from the start of the following 7 lines
-#syr = 2020 # First year to pull data. The first year in the dataset is 1979
-#eyr = 2020 # Last year to pull data. There is current data, but it is not finalized currently.
-#latitude = 40.06 # Latitude of the point of interest
-#longitude = -88.20 # Longitude of the point of interest
-#dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
-#locations = 'Energy_farm' #File Naming of location for now only. Can implement multiple sites later if needed.    
-#delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
-
-    
-# Changes all the inputs to numbers
-latitude = float(latitude)
-longitude = float(longitude)
-y = int(syr)
-
-# Create folders if they do not exist
-# First location to put the full data files
-NWK_vars = ['tmmn','tmmx','pr','srad','vs','rmax','rmin']
-for v in NWK_vars:
-    var_dir = dir + delim + v
-    if not os.path.exists(var_dir):
-        os.makedirs(var_dir)
-
-# Location to put the DayCent output data files
-output_dir = dir + delim + 'Output'
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-var_dir = output_dir + delim + locations
-if not os.path.exists(var_dir):
-    os.makedirs(var_dir)
-
-# Loop through the years needed
-while y<=int(eyr):
-
-# Minimum Air Temperature: 
-    url = 'http://www.northwestknowledge.net/metdata/data/tmmn' + '_' + str(y) + '.nc'
-    file = dir + delim + 'tmmn' + delim + 'tmmn_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-    
-    temp_min = xr.open_dataset(file)
-    temp_min = temp_min.sel(lat=latitude, lon=longitude,method = 'nearest')
-    temp_min = temp_min.rename({'day':'time'})
-    temp_min = temp_min.rename({'air_temperature':'tmmn'})
-    temp_min = temp_min.tmmn - 273.15
-    temp_min = temp_min.to_dataset()
-    temp_min = temp_min.astype('double')
-    temp_min.tmmn.attrs['units'] = 'deg C'
-    temp_min_array = temp_min.tmmn.to_numpy()
-    temp_min_array = np.round_(temp_min_array, decimals = 4)
-    xr.Dataset.close(temp_min)
-    print('Finished: '  + str(y) + ' Minimum Temperature')
-
-    # Maximum Air Temperature: 
-    url = 'http://www.northwestknowledge.net/metdata/data/tmmx' + '_' + str(y) + '.nc'
-    file = dir + delim +'tmmx' + delim + 'tmmx_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    temp_max = xr.open_dataset(file)
-    temp_max = temp_max.sel(lat=latitude, lon=longitude,method = 'nearest')
-    temp_max = temp_max.rename({'day':'time'})
-    temp_max = temp_max.rename({'air_temperature':'tmax'})
-    temp_max = temp_max.tmax - 273.15
-    temp_max = temp_max.to_dataset()
-    temp_max = temp_max.astype('double')
-    temp_max.tmax.attrs['units'] = 'deg C'
-    temp_max_array = temp_max.tmax.to_numpy()
-    temp_max_array = np.round_(temp_max_array, decimals = 4)
-    xr.Dataset.close(temp_max)
-    print('Finished: ' + str(y) + ' Maximum Temperature')
-
-    # Daily Precipitaiton Accumulation:
-    url = 'http://www.northwestknowledge.net/metdata/data/pr' + '_' + str(y) + '.nc'
-    file = dir + delim + 'pr' + delim + 'pr_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    precip = xr.open_dataset(file)
-    precip = precip.sel(lat=latitude, lon=longitude,method = 'nearest')
-    precip = precip.rename({'day':'time'})
-    precip = precip.rename({'precipitation_amount':'prec'})
-    precip = precip.astype('double')
-    precip = precip.prec * 0.1 #Convert to cm from mm
-    precip_array = precip.to_numpy()
-    precip_array = np.round_(precip_array, decimals = 4)
-    xr.Dataset.close(precip)
-    print('Finished: ' + str(y) + ' Precipitation')
- 
-# Surface Downwelling Shortwave Radiation: Output will be rads_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/srad' + '_' + str(y) + '.nc'
-    file = dir + delim + 'srad' + delim + 'srad_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    radiation = xr.open_dataset(file)
-    radiation = radiation.sel(lat=latitude, lon=longitude,method = 'nearest')
-    radiation = radiation.rename({'day':'time'})
-    radiation = radiation.rename({'surface_downwelling_shortwave_flux_in_air':'rads'})
-    radiation = radiation.astype('double')
-    radiation = radiation.rads / 0.484582 #Conversion from W/m2 to Langley/day
-    radiation_array = radiation.to_numpy()
-    radiation_array = np.round_(radiation_array, decimals = 4)
-    xr.Dataset.close(radiation)
-    print('Finished: ' + str(y) + ' Solar Radiation')
-
-    # Wind Speed: Output will be wspd_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/vs' + '_' + str(y) + '.nc'
-    file = dir + delim + 'vs' + delim + 'vs_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    wind = xr.open_dataset(file)
-    wind = wind.sel(lat=latitude, lon=longitude,method = 'nearest')
-    wind = wind.rename({'day':'time'})
-    wind = wind.rename({'wind_speed':'wspd'})
-    wind = wind.astype('double')
-    wind = wind.wspd * 2.23694 #Conversion from m/s to mph
-    wind_array = wind.to_numpy()
-    wind_array = np.round_(wind_array, decimals = 4)
-    xr.Dataset.close(wind)
-    print('Finished: ' + str(y) + ' Wind Speed')
-
-    # Maximum Relative Humidity: Output will be relh_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/rmax' + '_' + str(y) + '.nc'
-    file = dir + delim + 'rmax' + delim + 'rmax_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    rhmx = xr.open_dataset(file)
-    rhmx = rhmx.sel(lat=latitude, lon=longitude,method = 'nearest')
-    rhmx = rhmx.rename({'day':'time'})
-    rhmx = rhmx.rename({'relative_humidity':'relh'})
-    rhmx = rhmx.astype('double')
-    rhmx.relh.attrs['units'] = 'percent'
-    xr.Dataset.close(rhmx)
-    print('Finished: '  + str(y) + ' Maximum Relative Humidity')
-
-    # Minimum Relative Humidity: Output will be relh_yyyy.nc
-    url = 'http://www.northwestknowledge.net/metdata/data/rmin_' + str(y) + '.nc'
-    file = dir + delim + 'rmin' + delim + 'rmin_' + str(y) + '.nc'
-    if not os.path.exists(file):
-        f = wget.download(url, out=file)
-
-    rhmn = xr.open_dataset(file)
-    rhmn = rhmn.sel(lat=latitude, lon=longitude,method = 'nearest')
-    rhmn = rhmn.rename({'day':'time'})
-    rhmn = rhmn.rename({'relative_humidity':'relh'})
-    rhmn = rhmn.astype('double')
-    rhmn.relh.attrs['units'] = 'percent'
-    xr.Dataset.close(rhmn)
-    print('Finished: '  + str(y) + ' Minimum Relative Humidity')
-
-    #Average Relative Humidity: Output is relh_yyyy.nc
-    rh_ave = (rhmn.relh+rhmx.relh)/2
-    rh_ave_array = rh_ave.to_numpy()
-    rh_ave_array = np.round_(rh_ave_array, decimals = 4)
-    print('Finished: ' + str(y) + ' Average Relative Humidity')
-
-    #Put together time coordinates
-    day = precip.time.dt.day.to_numpy()
-    month = precip.time.dt.month.to_numpy()
-    year = precip.time.dt.year.to_numpy()
-    doy = precip.time.dt.dayofyear.to_numpy()   
-
-    #Create dataframe with all needed data for DayCent
-    output_dataframe = pd.DataFrame([day,month,year,doy,temp_max_array,temp_min_array,precip_array,radiation_array,rh_ave_array,wind_array]).transpose()
-
-    #Write weather data to text file formatted
-    output_file = dir + delim + 'DayCent_weather_' + locations + '_' + str(y) + '.txt'
-    print(output_file)
-    output_dataframe[0] = output_dataframe[0].astype(int)
-    output_dataframe[1] = output_dataframe[1].astype(int)
-    output_dataframe[2] = output_dataframe[2].astype(int)
-    output_dataframe[3] = output_dataframe[3].astype(int)
-    output_dataframe.to_csv(output_file, sep='\t', index=False, header=False)
-
-    print('Finished: ' + str(y) + ' Writing Output File')
-
-    y = y+1
\ No newline at end of file
+import os
+import sys
+import json
+import calendar
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+import xarray as xr
+import netCDF4
+import numpy as np
+import pandas as pd
+from gridMetDownload import GridMetDownloader, gridmet_resolution, gridmet_url, gridmet_subset_url
+from gridMetCache import GridMetCache
+from dayCentWriter import daycent_block, daycent_frame, write_daycent, daycent_last_doy
+from gridMetSiteIndex import index_sites, unique_cells, nearest_index, gridmet_lat, gridmet_lon
+
+# This is a Python script that will download minimum temperature, maximum temperature, precipitation, solar radiation, wind speed, and relative humidity.
+# # It will then process the data so it is in the netCDF format needed to be input in DayCent. It is customizable based on the years and spatial domain needed. Also the directory you want to download the data into
+# is an input.
+# It can be run from the command line for a single point, or imported so that get_daycent_weather() can be called for a list of sites in one process:
+#   from gridMetDayCent import get_daycent_weather
+#   get_daycent_weather([('Energy_farm', 40.06, -88.20)], 2019, 2020, dir, delim)
+# This was developed off a script provided by Theo Hartman from the Heaton Lab at Illinois.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# GridMet variables needed for DayCent, the name of the data variable inside each file, and the conversion to DayCent units
+NWK_vars = {
+    'tmmx': ('air_temperature', lambda data: (data - 273.15).astype('double')),                         # Kelvin to deg C
+    'tmmn': ('air_temperature', lambda data: (data - 273.15).astype('double')),                         # Kelvin to deg C
+    'pr':   ('precipitation_amount', lambda data: data.astype('double') * 0.1),                         # mm to cm
+    'srad': ('surface_downwelling_shortwave_flux_in_air', lambda data: data.astype('double') / 0.484582), # W/m2 to Langley/day
+    'vs':   ('wind_speed', lambda data: data.astype('double') * 2.23694),                               # m/s to mph
+    'rmax': ('relative_humidity', lambda data: data.astype('double')),                                  # percent
+    'rmin': ('relative_humidity', lambda data: data.astype('double')),                                  # percent
+}
+
+# This function returns the series of each grid cell for one GridMet variable and year, given as (lat_idx, lon_idx) on the
+# full GridMet grid (see gridMetSiteIndex.py). get_file(v, y) returns the path of the GridMet file, for example downloader.get.
+# The GridMet file is only read for the cells that are not in the cache, and those cells are pulled out of it in one vectorized
+# integer read. It returns the days and a 2D array of shape (number of days, number of cells) in DayCent units
+def extract_cells(v, y, cells, get_file, cache=None):
+    ncvar, convert = NWK_vars[v]
+    start, series = cache.get(v, y, cells) if cache is not None else (None, {})
+    missing = [cell for cell in cells if cell not in series]
+
+    if missing:
+        with xr.open_dataset(get_file(v, y)) as data:
+            # The file may be a subset of the grid, so find where its first cell sits on the full grid
+            lat_offset = int(nearest_index(gridmet_lat, float(data.lat[0])))
+            lon_offset = int(nearest_index(gridmet_lon, float(data.lon[0])))
+            points = data[ncvar].isel(lat=xr.DataArray([cell[0] - lat_offset for cell in missing], dims='site'),
+                                      lon=xr.DataArray([cell[1] - lon_offset for cell in missing], dims='site'))
+            values = points.transpose('day', 'site').to_numpy()
+            days = data.day.to_index()
+        for j, cell in enumerate(missing):
+            series[cell] = values[:, j]
+        if cache is not None:
+            cache.put(v, y, missing, days, values)
+    else:
+        days = pd.date_range(start, periods=len(series[cells[0]]))
+        print('Cached: ' + str(y) + ' ' + v)
+
+    print('Finished: ' + str(y) + ' ' + v)
+    return days, convert(np.stack([series[cell] for cell in cells], axis=1))
+
+# This function returns the series of each grid cell for one GridMet variable over several years, read from all the yearly
+# files opened together as one lazy multi-file dataset, so each cell's whole series comes out of a single indexed read.
+# The cache is not used. It returns the days and a 2D array of shape (number of days, number of cells) in DayCent units
+def extract_cells_stacked(v, years, cells, get_file):
+    ncvar, convert = NWK_vars[v]
+    files = [get_file(v, y) for y in years]
+    # Small spatial chunks so only the parts of the grid around the cells are read
+    with xr.open_mfdataset(files, combine='nested', concat_dim='day', data_vars='minimal', coords='minimal', compat='override',
+                           chunks={'day': -1, 'lat': 64, 'lon': 64}) as data:
+        lat_offset = int(nearest_index(gridmet_lat, float(data.lat[0])))
+        lon_offset = int(nearest_index(gridmet_lon, float(data.lon[0])))
+        points = data[ncvar].isel(lat=xr.DataArray([cell[0] - lat_offset for cell in cells], dims='site'),
+                                  lon=xr.DataArray([cell[1] - lon_offset for cell in cells], dims='site'))
+        values = points.transpose('day', 'site').to_numpy()
+        days = data.day.to_index()
+    print('Finished: ' + str(years[0]) + '-' + str(years[-1]) + ' ' + v)
+    return days, convert(values)
+
+# This function turns the series of each GridMet variable into the DayCent weather table of every grid cell.
+# data is {var: array of shape (number of days, number of cells)}. It returns a list of days x 10 arrays (see dayCentWriter.py)
+def build_daycent_blocks(time, data, n_cells):
+    # Variables can be updated on the server on different days, so only keep the days all of them have
+    n_days = min(len(data[v]) for v in data)
+    time = time[:n_days]
+    for v in data:
+        data[v] = data[v][:n_days]
+    data['relh'] = (data['rmin'] + data['rmax']) / 2
+    for v in data:
+        data[v] = np.round(data[v], decimals=4)
+
+    return [daycent_block(time, data['tmmx'][:, i], data['tmmn'][:, i], data['pr'][:, i], data['srad'][:, i],
+                          data['relh'][:, i], data['vs'][:, i]) for i in range(n_cells)]
+
+# This function builds the DayCent weather table of every grid cell for one year, reading each GridMet variable once.
+# It returns a list of days x 10 arrays in the same order as cells
+def daycent_blocks(y, cells, get_file, cache=None):
+    data = {}
+    for v in NWK_vars:
+        time, data[v] = extract_cells(v, y, cells, get_file, cache)
+    return build_daycent_blocks(time, data, len(cells))
+
+# This function builds the DayCent weather table of every grid cell for a range of years, reading each GridMet variable
+# for all the years at once (see extract_cells_stacked). It returns a list of days x 10 arrays in the same order as cells
+def daycent_blocks_stacked(years, cells, get_file):
+    data = {}
+    for v in NWK_vars:
+        time, data[v] = extract_cells_stacked(v, years, cells, get_file)
+    return build_daycent_blocks(time, data, len(cells))
+
+# This function builds the DayCent weather tables of one year in a worker process. The GridMet files of the year have already
+# been downloaded by the main process and are passed as {(var, year): path}, only for the variables with cells missing from the cache.
+# Each worker opens its own connection to the cache and does not evict from it, so the cells the main process found in the cache
+# are still there when the worker reads them. The main process evicts once all the workers are done.
+def daycent_blocks_worker(y, cells, files, cache_file=None, cache_size_mb=1024):
+    cache = GridMetCache(cache_file, cache_size_mb, auto_evict=False) if cache_file is not None else None
+    try:
+        return daycent_blocks(y, cells, lambda v, y: files[(v, y)], cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+# This function writes the DayCent weather of one year for every site, or adds it to the results dictionary if output_dir is None.
+# site_cell gives the position of the block of each site's grid cell
+def write_daycent_year(y, blocks, names, site_cell, output_dir, delim, results):
+    for name, i in zip(names, site_cell):
+        if output_dir is None:
+            results[(name, y)] = daycent_frame(blocks[i])
+            continue
+        output_file = daycent_file(output_dir, delim, name, y)
+        print(output_file)
+        write_daycent(output_file, blocks[i], decimals=4)
+        results.append(output_file)
+    print('Finished: ' + str(y) + ' Writing Output File')
+
+# This function returns the path of the DayCent weather file of a location and year
+def daycent_file(output_dir, delim, name, y):
+    return output_dir + delim + 'DayCent_weather_' + name + '_' + str(y) + '.txt'
+
+# The manifest used in incremental mode records, for each GridMet variable and year, the last day written to the DayCent files
+# and the Last-Modified of the server copy it came from: {'tmmx_2024': {'last_day': '2024-06-30', 'modified': '...'}}
+def load_manifest(file):
+    if not os.path.exists(file):
+        return {}
+    with open(file) as f:
+        return json.load(f)
+
+def save_manifest(file, manifest):
+    with open(file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(file + '.tmp', file)
+
+# This function returns True if a year may still get new or corrected days on the server: the current year, or a year
+# whose last update did not reach December 31
+def open_year(y, manifest):
+    if y >= datetime.date.today().year:
+        return True
+    return any(manifest.get(v + '_' + str(y), {}).get('last_day', str(y) + '-12-31') < str(y) + '-12-31' for v in NWK_vars)
+
+# This function appends the days of one year that are not in each site's DayCent file yet
+def append_daycent_year(y, blocks, names, site_cell, output_dir, delim, results):
+    for name, i in zip(names, site_cell):
+        output_file = daycent_file(output_dir, delim, name, y)
+        new_rows = blocks[i][blocks[i][:, 3] > daycent_last_doy(output_file)]
+        if len(new_rows) > 0:
+            write_daycent(output_file, new_rows, decimals=4, append=True)
+            print('Appended ' + str(len(new_rows)) + ' days: ' + output_file)
+        results.append(output_file)
+    print('Finished: ' + str(y) + ' Updating Output File')
+
+# This function gets the DayCent weather for a list of sites and a range of years without starting a new Python process for each site.
+# sites is a list of (location name, latitude, longitude), or a site index from gridMetSiteIndex.load_site_index() so the
+# nearest grid cells do not have to be looked up again. Sites in the same grid cell are only extracted once.
+# The GridMet files are downloaded to dir if needed,
+# by up to download_workers files at a time, and all years are queued up front so downloads overlap processing.
+# With subset=True only the grid cells around the sites are requested from the server instead of the whole CONUS files.
+# Series already pulled out for the same grid cells are read from a cache in dir (up to cache_size_mb, 0 turns it off),
+# and only the files with at least one cell missing from the cache are downloaded.
+# With year_workers > 1 the years are processed in parallel by that many worker processes, each one starting as soon as its
+# files are downloaded. A script that calls it this way needs an if __name__ == '__main__': guard on Windows.
+# With incremental=True years whose DayCent files are already complete are skipped, and for the current year only the days
+# after the last one written are fetched and appended to the files (see load_manifest). This needs output_dir.
+# With stacked=True all the years of a variable are opened together and each site's whole series is read at once instead of
+# year by year (the cache and year_workers are not used). With continuous=True as well, each site gets one file
+# output_dir/DayCent_weather_<location>_<syr>_<eyr>.txt with all the years instead of one file per year.
+# base_url is the server the whole GridMet files are downloaded from, for example a mirror or a local server, and subset_url the
+# THREDDS NetCDF Subset Service the subsets are requested from with subset=True.
+# If output_dir is given, each year is written to output_dir/DayCent_weather_<location>_<year>.txt and the list of files is returned.
+# Otherwise a dictionary of DataFrames keyed by (location name, year) is returned, or by location name with continuous=True.
+def get_daycent_weather(sites, syr, eyr, dir, delim, output_dir=None, download_workers=4, subset=False, cache_size_mb=1024, year_workers=1,
+                        incremental=False, stacked=False, continuous=False, base_url=gridmet_url,
+                        subset_url=gridmet_subset_url):
+    if incremental and output_dir is None:
+        raise ValueError('incremental mode appends to the DayCent files, so it needs an output_dir')
+    if incremental and stacked:
+        raise ValueError('incremental mode updates the yearly files one at a time, so it cannot be used with stacked')
+    if continuous and not stacked:
+        raise ValueError('continuous files are made from the stacked read, so continuous needs stacked=True')
+    if isinstance(sites, pd.DataFrame):
+        site_index = sites
+    else:
+        site_index = index_sites([site[0] for site in sites], [float(site[1]) for site in sites], [float(site[2]) for site in sites])
+    names = site_index['LocationName'].tolist()
+    lats = site_index['Latitude'].to_numpy()
+    lons = site_index['Longitude'].to_numpy()
+    cells, site_cell = unique_cells(site_index)
+    bbox = None
+    if subset:
+        # Pad by two grid cells so the nearest cell of every site is inside the subset
+        pad = 2 * gridmet_resolution
+        bbox = (lats.max() + pad, lats.min() - pad, lons.min() - pad, lons.max() + pad)
+    if output_dir is not None and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    results = [] if output_dir is not None else {}
+    years = range(int(syr), int(eyr) + 1)
+    if stacked:
+        with GridMetDownloader(dir, delim, workers=download_workers, bbox=bbox, base_url=base_url, subset_url=subset_url) as downloader:
+            downloader.prefetch(NWK_vars, years)
+            blocks = daycent_blocks_stacked(years, cells, downloader.get)
+        if continuous:
+            for name, i in zip(names, site_cell):
+                if output_dir is None:
+                    results[name] = daycent_frame(blocks[i])
+                    continue
+                output_file = output_dir + delim + 'DayCent_weather_' + name + '_' + str(years[0]) + '_' + str(years[-1]) + '.txt'
+                print(output_file)
+                write_daycent(output_file, blocks[i], decimals=4)
+                results.append(output_file)
+        else:
+            for y in years:
+                year_blocks = [block[block[:, 2] == y] for block in blocks]
+                write_daycent_year(y, year_blocks, names, site_cell, output_dir, delim, results)
+        return results
+
+    cache_file = dir + delim + 'gridmet_point_cache.sqlite' if cache_size_mb > 0 else None
+    cache = GridMetCache(cache_file, cache_size_mb) if cache_file is not None else None
+    manifest_file = dir + delim + 'gridmet_manifest.json'
+    manifest = load_manifest(manifest_file) if incremental else {}
+    with GridMetDownloader(dir, delim, workers=download_workers, bbox=bbox, base_url=base_url, subset_url=subset_url) as downloader:
+        needed = {}
+        updates = {}
+        for y in years:
+            if incremental:
+                written = min(daycent_last_doy(daycent_file(output_dir, delim, name, y)) for name in names)
+                if written >= (366 if calendar.isleap(y) else 365):
+                    print('Up to date: ' + str(y))
+                    results.extend(daycent_file(output_dir, delim, name, y) for name in names)
+                    continue
+                if open_year(y, manifest):
+                    since = (datetime.date(y, 1, 1) + datetime.timedelta(days=written)).isoformat()
+                    updates[y] = {v: downloader.submit_refresh(v, y, since, manifest.get(v + '_' + str(y), {}).get('modified'))
+                                  for v in NWK_vars}
+                    continue
+            needed[y] = [v for v in NWK_vars if cache is None or cache.missing(v, y, cells)]
+            for v in needed[y]:
+                downloader.submit(v, y)
+
+        if year_workers > 1:
+            # Hand each year to the process pool once its files are downloaded, then gather the years in order
+            with ProcessPoolExecutor(max_workers=year_workers) as pool:
+                futures = {}
+                for y in needed:
+                    files = {(v, y): downloader.get(v, y) for v in needed[y]}
+                    futures[y] = pool.submit(daycent_blocks_worker, y, cells, files, cache_file, cache_size_mb)
+                for y in needed:
+                    write_daycent_year(y, futures[y].result(), names, site_cell, output_dir, delim, results)
+            if cache is not None:
+                cache.evict()
+        else:
+            for y in needed:
+                blocks = daycent_blocks(y, cells, downloader.get, cache)
+                write_daycent_year(y, blocks, names, site_cell, output_dir, delim, results)
+
+        # Years still being updated are read from the refreshed files, which may only hold the new days, so the cache is not used
+        for y in updates:
+            blocks = daycent_blocks(y, cells, lambda v, y: updates[y][v].result()[0])
+            append_daycent_year(y, blocks, names, site_cell, output_dir, delim, results)
+            last_day = datetime.date(*[int(x) for x in blocks[0][-1, [2, 1, 0]]]).isoformat()
+            for v in NWK_vars:
+                manifest[v + '_' + str(y)] = {'last_day': last_day, 'modified': updates[y][v].result()[1]}
+            save_manifest(manifest_file, manifest)
+    if cache is not None:
+        cache.close()
+    return results
+
+if __name__ == '__main__':
+    # Get the arguments passed through command line - uncomment if using
+    syr, eyr, latitude, longitude, dir, locations, delim = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6], sys.argv[7]
+
+    # Inputs to change for only a single latitude/longitude point. Remove the # from the start of the following 7 lines
+    #syr = 2020 # First year to pull data. The first year in the dataset is 1979
+    #eyr = 2020 # Last year to pull data. There is current data, but it is not finalized currently.
+    #latitude = 40.06 # Latitude of the point of interest
+    #longitude = -88.20 # Longitude of the point of interest
+    #dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
+    #locations = 'Energy_farm' #File Naming of location for now only. Can implement multiple sites later if needed.
+    #delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
+
+    # Add subset after the 7 arguments to download only the grid cells around the point instead of the whole CONUS files,
+    # and update to only add the new days of the current year to the existing DayCent files
+    subset = 'subset' in sys.argv[8:]
+    incremental = 'update' in sys.argv[8:]
+
+    get_daycent_weather([(locations, latitude, longitude)], syr, eyr, dir, delim, output_dir=dir, subset=subset, incremental=incremental)
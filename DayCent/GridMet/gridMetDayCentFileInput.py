@@ -1,26 +1,48 @@
-import os
-import sys
-import numpy as np
-import pandas as pd
-import subprocess
-
-# This is a Python script that will take a comma-delimited file that contains a list of lat/lon coordinates to get gridMET data and put it in DayCent format. 
-# The file should have the following columns: LocationName, Latitude, Longitude
-# For questions, email Leslie Stoecker, lensor@illinois.edu
-
-# Inputs to change
-syr = '2019' # First year to pull data. The first year in the dataset is 1979.
-eyr = '2020' # Last year to pull data. There is current data, but it is not finalized currently.
-dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
-delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
-filename = 'DayCent_Locations_Example_File.csv' # Comma-delimited file with the following columns: LocationName, Latitude, Longitude
-
-# Open the DayCent Location File and put it in an array
-locationArray = np.loadtxt(filename, delimiter=',', dtype=str)
-
-# Loop through each line of the file and pass the lat/lon to gridMetDayCent.py to get the data
-for line in locationArray:
-    if line[0] == 'LocationName': continue
-
-    subprocess.run(['python', 'gridMetDayCent.py', syr, eyr, line[1], line[2], dir, line[0], delim])
-    print('Finished: ' + line[0])
+import os
+import sys
+from gridMetDayCent import get_daycent_weather
+from gridMetDownload import gridmet_url, gridmet_subset_url
+from gridMetSiteIndex import load_site_index
+
+# This is a Python script that will take a comma-delimited file that contains a list of lat/lon coordinates to get gridMET data and put it in DayCent format.
+# The file should have the following columns: LocationName, Latitude, Longitude
+# By default it runs in batch mode: each yearly GridMet file is opened once and every location is pulled out of it in a single read,
+# so the run time grows with the number of years and variables instead of the number of locations.
+# The nearest GridMet grid cell of each location is looked up once and saved next to the file as <filename>_gridmet_index.csv,
+# so later runs with the same locations skip the lookup. Locations that fall in the same grid cell are only extracted once.
+# gridMetDayCent.py is imported and called in this process, so it needs to be in the same directory as this script.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# Inputs to change
+syr = '2019' # First year to pull data. The first year in the dataset is 1979.
+eyr = '2020' # Last year to pull data. There is current data, but it is not finalized currently.
+dir = 'C:\\Users\\IGB\\Box\\Sustainability Hub\\GridMet Data Download\\' # Directory where all the files will be stored
+delim = '\\' # Customizable file/directory delimiter depending on the system you are running it on
+filename = 'DayCent_Locations_Example_File.csv' # Comma-delimited file with the following columns: LocationName, Latitude, Longitude
+batch = True # True opens each GridMet file once for all locations. False processes the locations one at a time
+download_workers = 4 # Number of GridMet files to download at the same time
+base_url = gridmet_url # Server the whole GridMet files are downloaded from. Change it to use a mirror or a local copy of the files
+cache_size_mb = 1024 # Disk space for the cache of series already pulled out for a grid cell, so reruns skip the GridMet files. 0 turns it off
+subset = False # True downloads only the grid cells around the locations instead of the whole CONUS files. Best when the locations are close together
+subset_url = gridmet_subset_url # THREDDS NetCDF Subset Service the subsets are requested from when subset is True. Change it to use a mirror or a local server
+incremental = False # True skips years already written and only adds the new days of the current year to the DayCent files
+stacked = False # True reads all the years of a variable at once instead of year by year. Needs dask
+continuous = False # With stacked, True writes one file per location with all the years instead of one file per year
+year_workers = 1 # Number of years to process at the same time in separate processes. Set it to the number of cores for long year ranges
+
+# The guard is needed when year_workers > 1, because each worker process imports this script again
+if __name__ == '__main__':
+    # Open the DayCent Location File and match each location to its GridMet grid cell
+    siteIndex = load_site_index(filename)
+
+    if batch:
+        get_daycent_weather(siteIndex, syr, eyr, dir, delim, output_dir=dir, download_workers=download_workers, subset=subset,
+                            cache_size_mb=cache_size_mb, year_workers=year_workers, incremental=incremental,
+                            stacked=stacked, continuous=continuous, base_url=base_url, subset_url=subset_url)
+    else:
+        # Loop through each line of the file and pass the lat/lon to gridMetDayCent.py to get the data
+        for i in range(len(siteIndex)):
+            get_daycent_weather(siteIndex.iloc[[i]], syr, eyr, dir, delim, output_dir=dir, download_workers=download_workers, subset=subset,
+                                cache_size_mb=cache_size_mb, year_workers=year_workers, incremental=incremental,
+                                stacked=stacked, continuous=continuous, base_url=base_url, subset_url=subset_url)
+            print('Finished: ' + siteIndex['LocationName'].iloc[i])
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pandas as pd
+from gridMetDownload import gridmet_resolution
+
+# This is a Python module that matches each site in a locations file to its nearest GridMet grid cell once, instead of
+# searching the grid again for every variable and year. The result is saved next to the locations file as
+# <locations file>_gridmet_index.csv with the columns LocationName, Latitude, Longitude, lat_idx, lon_idx, cell_lat, cell_lon,
+# where lat_idx and lon_idx are the position of the cell on the full GridMet CONUS grid. The index is rebuilt if the locations change.
+# Sites that fall in the same 4 km cell share one extraction.
+# For questions, email Leslie Stoecker, lensor@illinois.edu
+
+# The GridMet CONUS grid: latitudes from north to south and longitudes from west to east, gridmet_resolution apart
+gridmet_north = 49.4
+gridmet_west = -124.76666666666667
+gridmet_nlat = 585
+gridmet_nlon = 1386
+gridmet_lat = gridmet_north - np.arange(gridmet_nlat) * gridmet_resolution
+gridmet_lon = gridmet_west + np.arange(gridmet_nlon) * gridmet_resolution
+
+# This function returns the index of the nearest value in a sorted 1D coordinate array for every value, in one vectorized search.
+# The coordinates can be ascending or descending. Values outside the grid get the nearest edge.
+def nearest_index(coords, values):
+    coords = np.asarray(coords, dtype=float)
+    values = np.asarray(values, dtype=float)
+    descending = coords[0] > coords[-1]
+    if descending:
+        coords = coords[::-1]
+    right = np.clip(np.searchsorted(coords, values), 1, len(coords) - 1)
+    left = right - 1
+    index = np.where(np.abs(values - coords[left]) <= np.abs(coords[right] - values), left, right)
+    return len(coords) - 1 - index if descending else index
+
+# This function returns the (lat_idx, lon_idx) of the GridMet cell nearest to each latitude/longitude
+def gridmet_cells(lats, lons):
+    return nearest_index(gridmet_lat, lats), nearest_index(gridmet_lon, lons)
+
+# This function builds the site index for a list of names, latitudes and longitudes
+def index_sites(names, lats, lons):
+    lat_idx, lon_idx = gridmet_cells(lats, lons)
+    return pd.DataFrame({
+        'LocationName': np.asarray(names, dtype=str), 'Latitude': np.asarray(lats, dtype=float), 'Longitude': np.asarray(lons, dtype=float),
+        'lat_idx': lat_idx, 'lon_idx': lon_idx, 'cell_lat': np.round(gridmet_lat[lat_idx], 6), 'cell_lon': np.round(gridmet_lon[lon_idx], 6)})
+
+# This function returns the unique cells of a site index and, for each site, the position of its cell in that list
+def unique_cells(site_index):
+    cells, inverse = np.unique(site_index[['lat_idx', 'lon_idx']].to_numpy(), axis=0, return_inverse=True)
+    return [tuple(cell) for cell in cells.tolist()], inverse.reshape(-1)
+
+# This function returns the site index of a locations file (columns LocationName, Latitude, Longitude), reading the saved
+# index if it matches the locations and building and saving it otherwise
+def load_site_index(filename):
+    locations = pd.read_csv(filename, dtype={'LocationName': str})
+    index_file = os.path.splitext(filename)[0] + '_gridmet_index.csv'
+    if os.path.exists(index_file):
+        site_index = pd.read_csv(index_file, dtype={'LocationName': str})
+        if site_index[['LocationName', 'Latitude', 'Longitude']].equals(locations[['LocationName', 'Latitude', 'Longitude']]):
+            return site_index
+    site_index = index_sites(locations['LocationName'], locations['Latitude'], locations['Longitude'])
+    site_index.to_csv(index_file, index=False)
+    print('Saved the GridMet site index: ' + index_file)
+    return site_index